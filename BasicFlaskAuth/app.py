@@ -1,5 +1,9 @@
 from flask import Flask, request, abort
 import json
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
 from jose import jwt
 from urllib.request import urlopen
@@ -11,6 +15,14 @@ AUTH0_DOMAIN = @TODO_REPLACE_WITH_YOUR_DOMAIN
 ALGORITHMS = ['RS256']
 API_AUDIENCE = @TODO_REPLACE_WITH_YOUR_API_AUDIENCE
 
+# Payloads of tokens we've already verified, so the same token sent over
+# and over is only checked once.  Keyed by a hash of the token and kept
+# until its exp.  0 turns it off.
+TOKEN_CACHE_SIZE = 1024
+# Seconds before a cached token makes us fetch the JWKS again, dropping
+# tokens signed by keys that have been rotated out.
+JWKS_TTL = 3600
+
 
 class AuthError(Exception):
     def __init__(self, error, status_code):
@@ -51,9 +63,72 @@ def get_token_auth_header():
     return token
 
 
-def verify_decode_jwt(token):
+class TokenCache:
+    """Bounded LRU of token hash -> (exp, kid, payload, permissions)
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        """Returns (payload, permissions) or None
+        """
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[2], entry[3]
+
+    def set(self, token, kid, payload):
+        """Caches payload and returns its permissions as a frozenset
+        """
+        permissions = frozenset(payload.get('permissions', ()))
+        exp = payload.get('exp')
+        if self.max_entries and isinstance(exp, (int, float)):
+            key = self._key(token)
+            with self._lock:
+                self._entries[key] = (exp, kid, payload, permissions)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return permissions
+
+    def keep_kids(self, kids):
+        """Drops tokens signed by keys no longer in the JWKS
+        """
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry[1] not in kids:
+                    del self._entries[key]
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+jwks_fetched_at = 0
+
+
+def fetch_jwks():
+    """Fetches the signing keys and drops cached tokens signed by others
+    """
+    global jwks_fetched_at
     jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
     jwks = json.loads(jsonurl.read())
+    jwks_fetched_at = time.time()
+    token_cache.keep_kids({key['kid'] for key in jwks['keys']})
+    return jwks
+
+
+def verify_decode_jwt(token):
+    jwks = fetch_jwks()
     unverified_header = jwt.get_unverified_header(token)
     rsa_key = {}
     if 'kid' not in unverified_header:
@@ -105,20 +180,49 @@ def verify_decode_jwt(token):
             }, 400)
 
 
-def requires_auth(f):
-    @wraps(f)
-    def wrapper(*args, **kwargs):
-        token = get_token_auth_header()
-        try:
-            payload = verify_decode_jwt(token)
-        except:
-            abort(401)
-        return f(payload, *args, **kwargs)
-
-    return wrapper
+def check_permissions(permission, permissions):
+    if permission not in permissions:
+        raise AuthError({
+            'code': 'unauthorized',
+            'description': 'Permission not found.'
+        }, 403)
+    return True
+
+
+def requires_auth(permission=''):
+    def requires_auth_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            token = get_token_auth_header()
+            cached = token_cache.get(token)
+            if cached is not None and time.time() - jwks_fetched_at > JWKS_TTL:
+                # the keys may have rotated since the token was cached
+                try:
+                    fetch_jwks()
+                except:
+                    abort(401)
+                cached = token_cache.get(token)
+            if cached is None:
+                try:
+                    payload = verify_decode_jwt(token)
+                except:
+                    abort(401)
+                kid = jwt.get_unverified_header(token)['kid']
+                permissions = token_cache.set(token, kid, payload)
+            else:
+                payload, permissions = cached
+            if permission:
+                try:
+                    check_permissions(permission, permissions)
+                except AuthError:
+                    abort(403)
+            return f(payload, *args, **kwargs)
+
+        return wrapper
+    return requires_auth_decorator
 
 @app.route('/headers')
-@requires_auth
+@requires_auth()
 def headers(payload):
     print(payload)
     return 'Access Granted'
\ No newline at end of file
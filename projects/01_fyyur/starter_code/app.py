@@ -1,61 +1,76 @@
 from flask import Flask, render_template
-from datetime import datetime
 from flask_moment import Moment
 from logging import Formatter, FileHandler
-from flask_migrate import Migrate
 import logging
-import dateutil.parser
-import babel
 
-from db import db
+from db import db, init_query_counter, sql_stats
+from dbengine import configure_engine
+from formatting import format_datetime
+from instrument import Instrumentation
 import controllers
+import counters
+import areas
+import bulkload
+import pagecache
+import querylog
+import search_index
 
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
-app = Flask(__name__)
 
-moment = Moment(app)
-app.config.from_object('config')
+def create_app(config='config', migrate=True, **settings):
+  """
+  Make the app, configured from config (an object or the name of one)
+  and then settings.  migrate=False leaves out the `flask db` migration
+  commands and so never imports alembic, which web workers don't need.
+  """
+  app = Flask(__name__)
 
-db.init_app(app)
-migrate = Migrate(app, db)
+  Moment(app)
+  app.config.from_object(config)
+  app.config.update(settings)
 
-controllers.register_view_funcs(app)
+  configure_engine(app)
+  db.init_app(app)
+  if migrate:
+    from flask_migrate import Migrate
+    Migrate(app, db)
+  init_query_counter(app)
+  Instrumentation(app, sql_stats=sql_stats)
 
+  controllers.register_view_funcs(app)
+  counters.register_commands(app)
+  areas.register_commands(app)
+  bulkload.register_commands(app)
+  pagecache.init_app(app)
+  querylog.init_app(app)
+  search_index.init_app(app)
 
-def format_datetime(value, format='medium'):
-  if isinstance(value, datetime):
-    date = value
-  else:
-    date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
 
-app.jinja_env.filters['datetime'] = format_datetime
+  app.jinja_env.filters['datetime'] = format_datetime
 
 
-@app.errorhandler(404)
-def not_found_error(error):
-    return render_template('errors/404.html'), 404
+  @app.errorhandler(404)
+  def not_found_error(error):
+      return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
-def server_error(error):
-    return render_template('errors/500.html'), 500
+  @app.errorhandler(500)
+  def server_error(error):
+      return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+  if not app.debug:
+      file_handler = FileHandler('error.log')
+      file_handler.setFormatter(
+          Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+      )
+      app.logger.setLevel(logging.INFO)
+      file_handler.setLevel(logging.INFO)
+      app.logger.addHandler(file_handler)
+      app.logger.info('errors')
+
+  return app
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -63,11 +78,11 @@ if not app.debug:
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
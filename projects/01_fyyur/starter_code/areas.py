@@ -0,0 +1,155 @@
+#The area table holds one row per (state, city) with venues in it and how
+#many there are, so the venue listing can page through areas, and show
+#one area a page at a time, without grouping every venue on each request.
+#
+#It is kept current by ORM events on Venue as venues are added, moved and
+#deleted.  Areas whose last venue goes stay behind with no venues, and
+#are skipped by the listing until `flask refresh-areas` drops them.
+#`flask check-areas` compares the table with the venues.
+#Anything writing the venue table without the ORM (bulkload.py) should
+#run the refresh.
+
+import sys
+
+import click
+from sqlalchemy import and_, event, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import get_history
+
+from models import Venue, Area
+from db import db
+
+#----------------------------------------------------------------------------#
+# Venue events.
+#----------------------------------------------------------------------------#
+
+#dialects with INSERT ... ON CONFLICT, sqlite's from SQLAlchemy 1.4
+UPSERTS = {dialect.__name__.split('.')[-1]: dialect.insert
+           for dialect in (postgresql, sqlite) if hasattr(dialect, 'insert')}
+
+
+def _update(connection, state, city, n):
+  table = Area.__table__
+  return connection.execute(
+    table.update().
+          where(and_(table.c.state == state, table.c.city == city)).
+          values(num_venues=table.c.num_venues + n)
+  ).rowcount
+
+
+def _add(connection, state, city, n):
+  """
+  Add n venues to an area, creating it if need be, even when another
+  transaction is creating it too.
+  """
+  table = Area.__table__
+  upsert = UPSERTS.get(connection.dialect.name)
+  if upsert is not None:
+    insert = upsert(table).values(state=state, city=city, num_venues=n)
+    connection.execute(insert.on_conflict_do_update(
+      index_elements=[table.c.state, table.c.city],
+      set_={'num_venues': table.c.num_venues + insert.excluded.num_venues}))
+    return
+  if _update(connection, state, city, n):
+    return
+  try:
+    with connection.begin_nested():
+      connection.execute(table.insert().values(state=state, city=city, num_venues=n))
+  except IntegrityError:
+    #it was added since the update
+    _update(connection, state, city, n)
+
+
+def _adjust(connection, state, city, n):
+  if n > 0:
+    _add(connection, state, city, n)
+  else:
+    _update(connection, state, city, n)
+
+
+@event.listens_for(Venue, 'after_insert')
+def _venue_inserted(mapper, connection, venue):
+  _adjust(connection, venue.state, venue.city, 1)
+
+
+@event.listens_for(Venue, 'after_delete')
+def _venue_deleted(mapper, connection, venue):
+  _adjust(connection, venue.state, venue.city, -1)
+
+
+#as in counters.py, load the old value when these are set so an expired
+#venue's history still says where it was
+@event.listens_for(Venue.state, 'set', active_history=True)
+@event.listens_for(Venue.city, 'set', active_history=True)
+def _load_old_value(venue, value, oldvalue, initiator):
+  pass
+
+
+@event.listens_for(Venue, 'after_update')
+def _venue_updated(mapper, connection, venue):
+  old = []
+  for attr in ('state', 'city'):
+    history = get_history(venue, attr)
+    old.append(history.deleted[0] if history.deleted else getattr(venue, attr))
+  new = [venue.state, venue.city]
+  if old != new:
+    _adjust(connection, *old, -1)
+    _adjust(connection, *new, 1)
+
+#----------------------------------------------------------------------------#
+# Refresh and check.
+#----------------------------------------------------------------------------#
+
+def _live_counts():
+  """{(state, city): number of venues} from the venue table."""
+  query = db.session.query(Venue.state, Venue.city, func.count(Venue.id)).\
+                     group_by(Venue.state, Venue.city)
+  return {(state, city): n for state, city, n in query}
+
+
+def refresh_areas():
+  """Recount the venues of every area, adding and dropping areas to match."""
+  live = _live_counts()
+  stored = {(area.state, area.city): area for area in Area.query}
+  for key, area in stored.items():
+    if key not in live:
+      db.session.delete(area)
+    elif area.num_venues != live[key]:
+      area.num_venues = live[key]
+  added = [{'state': state, 'city': city, 'num_venues': n}
+           for (state, city), n in live.items() if (state, city) not in stored]
+  if added:
+    db.session.execute(Area.__table__.insert(), added)
+  db.session.commit()
+
+
+def check_areas():
+  """
+  Return (state, city, stored, actual) for every area whose stored venue
+  count disagrees with the venue table, None meaning no row.
+  """
+  live = _live_counts()
+  stored = {(area.state, area.city): area.num_venues for area in Area.query}
+  wrong = []
+  for key in sorted(set(live) | set(stored)):
+    #an empty area left behind isn't wrong, the listing skips it
+    if stored.get(key, 0) != live.get(key, 0):
+      wrong.append((*key, stored.get(key), live.get(key, 0)))
+  return wrong
+
+
+def register_commands(app):
+  @app.cli.command('refresh-areas')
+  def refresh():
+    """Recount the venues in every city."""
+    refresh_areas()
+
+  @app.cli.command('check-areas')
+  def check():
+    """List cities whose venue count is wrong."""
+    wrong = check_areas()
+    for state, city, stored, actual in wrong:
+      click.echo(f'{city}, {state}: stored {stored}, actually {actual}')
+    click.echo(f'{len(wrong)} wrong')
+    sys.exit(1 if wrong else 0)
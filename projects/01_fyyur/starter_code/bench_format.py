@@ -0,0 +1,94 @@
+#Benchmark for the datetime filter in formatting.py.
+#
+#Renders the /shows template for 10k shows spread like loadtest.py's, on
+#evening half hours over three years, with the old filter (dateutil and
+#babel.dates.format_datetime on every call) and with formatting.py's,
+#after checking the two agree, then times the filter alone over the same
+#start times.  No database is needed.
+#
+#usage: python bench_format.py
+
+import sys
+import timeit
+from datetime import datetime, timedelta
+from random import Random
+
+import babel.dates
+import dateutil.parser
+from flask import render_template
+
+from app import create_app
+import formatting
+
+SHOWS = 10000
+REPEAT = 3
+
+
+def old_format_datetime(value, format='medium'):
+  if isinstance(value, datetime):
+    date = value
+  else:
+    date = dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format)
+
+
+def shows(n):
+  rand = Random(0)
+  today = datetime(2026, 1, 1)
+  for i in range(n):
+    day = today + timedelta(days=rand.randint(-730, 365))
+    yield {
+      'venue_id': i, 'artist_id': i, 'venue_name': f'Venue {i}', 'artist_name': f'Artist {i}',
+      'artist_image_link': '',
+      'start_time': day + timedelta(minutes=30 * rand.randint(36, 47)),
+    }
+
+
+def main():
+  app = create_app(migrate=False)
+  data = list(shows(SHOWS))
+  values = [show['start_time'] for show in data[:500]]
+  values += [value.isoformat() for value in values[:100]]
+  values += ['2019-05-21T21:30:00.000Z', '2035-04-01T20:00:00.000Z', 'May 21 2019 9:30pm']
+  for value in values:
+    for format in ('full', 'medium', 'short'):
+      assert formatting.format_datetime(value, format) == old_format_datetime(value, format), (value, format)
+
+  def render(filter):
+    app.jinja_env.filters['datetime'] = filter
+    with app.test_request_context('/shows'):
+      return render_template('pages/shows.html', shows=data)
+
+  def cold_cache():
+    formatting.format_datetime.cache_clear()
+    return render(formatting.format_datetime)
+
+  assert render(old_format_datetime) == render(formatting.format_datetime)
+  print(f'{SHOWS} shows, {len({show["start_time"] for show in data})} distinct start times')
+  results = [
+    ('old filter', lambda: render(old_format_datetime)),
+    ('new filter, empty cache', cold_cache),
+    ('new filter, warm cache', lambda: render(formatting.format_datetime)),
+  ]
+  times = [show['start_time'] for show in data]
+
+  def filter_only(filter):
+    for value in times:
+      filter(value, 'full')
+
+  results += [
+    ('old filter alone', lambda: filter_only(old_format_datetime)),
+    ('new filter alone, warm', lambda: filter_only(formatting.format_datetime)),
+  ]
+  for name, run in results:
+    seconds = min(timeit.repeat(run, number=1, repeat=REPEAT))
+    print(f'{name:26}{seconds * 1000:8.1f} ms')
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,104 @@
+#Benchmark for the upcoming show counters in counters.py.
+#
+#Fills a throwaway sqlite database with 100k shows, then times the old
+#per-request aggregate against reading the stored counts for the venue
+#listing and a search, plus a full refresh and a consistency check.
+#sqlite numbers are only good for comparing with each other.
+#
+#usage: python bench_upcoming.py
+
+import os
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+from random import Random
+
+from flask import Flask
+from sqlalchemy import func
+
+from db import db
+from models import Venue, Artist, Show
+import counters
+
+VENUES = 1000
+ARTISTS = 5000
+SHOWS = 100000
+REPEAT = 5
+
+
+def fill():
+  rand = Random(0)
+  now = datetime.now()
+  place = lambda i: {'city': f'City {i % 300}', 'state': f'S{i % 50}', 'phone': '555-555-5555'}
+  db.session.execute(Venue.__table__.insert(), [
+    dict(place(i), id=i, name=f'Venue {i}', address=f'{i} Main St')
+    for i in range(1, VENUES + 1)])
+  db.session.execute(Artist.__table__.insert(), [
+    dict(place(i), id=i, name=f'Artist {i}')
+    for i in range(1, ARTISTS + 1)])
+  #a year either side of now
+  db.session.execute(Show.__table__.insert(), [{
+    'venue_id': rand.randint(1, VENUES),
+    'artist_id': rand.randint(1, ARTISTS),
+    'start_time': now + timedelta(minutes=rand.randint(-525600, 525600))
+  } for _ in range(SHOWS)])
+  db.session.commit()
+
+
+def old_venues():
+  future_shows = Show.query.filter(Show.start_time > datetime.now()).subquery()
+  return db.session.query(Venue.name, Venue.city, Venue.state, Venue.id,
+                          func.count(future_shows.c.start_time)).\
+                    outerjoin(future_shows).\
+                    group_by(Venue.id).\
+                    order_by(Venue.state, Venue.city).\
+                    all()
+
+
+def new_venues():
+  return db.session.query(Venue.name, Venue.city, Venue.state, Venue.id,
+                          Venue.num_upcoming_shows).\
+                    order_by(Venue.state, Venue.city).\
+                    all()
+
+
+def old_search(term):
+  future_shows = Show.query.filter(Show.start_time > datetime.now()).subquery()
+  return db.session.query(Artist.id, Artist.name,
+                          func.count(future_shows.c.start_time)).\
+                    filter(Artist.name.ilike(f'%{term}%')).\
+                    outerjoin(future_shows).\
+                    group_by(Artist.id).\
+                    all()
+
+
+def new_search(term):
+  return db.session.query(Artist.id, Artist.name, Artist.num_upcoming_shows).\
+                    filter(Artist.name.ilike(f'%{term}%')).\
+                    all()
+
+
+def ms(f, *args):
+  return min(timeit.repeat(lambda: f(*args), number=1, repeat=REPEAT)) * 1000
+
+
+def main():
+  app = Flask(__name__)
+  app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+  app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+  db.init_app(app)
+  with app.app_context():
+    db.create_all()
+    fill()
+    print(f'refresh all counts  {ms(counters.refresh_upcoming_counts):9.1f} ms')
+    print(f'check all counts    {ms(counters.check_upcoming_counts):9.1f} ms')
+    print(f'wrong counts        {len(counters.check_upcoming_counts()):9d}')
+    print(f'{"":20}{"aggregate ms":>13}{"counter ms":>13}')
+    print(f'{"/venues":20}{ms(old_venues):13.1f}{ms(new_venues):13.1f}')
+    print(f'{"/artists/search":20}{ms(old_search, "12"):13.1f}{ms(new_search, "12"):13.1f}')
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,331 @@
+#Bulk loading venues, artists and shows from CSV or NDJSON files.
+#
+#  $ flask load-data venues venues.csv
+#  $ flask load-data artists artists.ndjson
+#  $ flask load-data shows shows.csv --rejects bad_shows.ndjson
+#
+#Files are read a row at a time and written in batches, with COPY on
+#PostgreSQL and executemany inserts elsewhere, so memory stays flat no
+#matter how many rows there are.  Columns are named as in models.py; for
+#shows, venue and artist may be given by name instead of id, looked up
+#in a name->id map read once before loading.  Rows that can't be loaded
+#are counted, and written to the --rejects file with the reason.
+#
+#Venues and artists may list genres, as a list in NDJSON or comma joined in
+#CSV.  Their genre links are written with each batch, so rows without an
+#id are given one after the highest id in the table; don't mix rows with
+#and without ids in one file.
+#
+#Loading skips the ORM, so the upcoming show counters are recounted after
+#loading shows (see counters.py), and the venues in each area after
+#loading venues (see areas.py).
+
+import csv
+import io
+import json
+import sys
+import time
+from datetime import datetime, timezone
+
+import click
+from sqlalchemy import text
+
+from models import Venue, Artist, Show, Genre, venue_genre, artist_genre
+from db import db
+import counters
+import areas
+
+
+MODELS = {'venues': Venue, 'artists': Artist, 'shows': Show}
+GENRE_TABLES = {Venue: venue_genre, Artist: artist_genre}
+TRUE = {'1', 'true', 't', 'yes', 'y'}
+
+
+class Reject(ValueError):
+  pass
+
+#----------------------------------------------------------------------------#
+# Reading.
+#----------------------------------------------------------------------------#
+
+def read_rows(path, format=None):
+  """Yield a dict per row of a CSV or NDJSON file, by extension unless format says."""
+  format = format or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+  with open(path, newline='', encoding='utf-8') as f:
+    if format == 'csv':
+      yield from csv.DictReader(f)
+    else:
+      for line in f:
+        if line.strip():
+          yield json.loads(line)
+
+
+def name_map(model):
+  """
+  (lowercased name: id, set of ids) for every row of model.  Names used
+  by more than one row map to None, since they can't say which is meant.
+  """
+  names, ids = {}, set()
+  for id_, name in db.session.query(model.id, model.name):
+    key = name.strip().lower()
+    names[key] = None if key in names else id_
+    ids.add(id_)
+  return names, ids
+
+#----------------------------------------------------------------------------#
+# Converting.
+#----------------------------------------------------------------------------#
+
+def _columns(model):
+  """The columns a file can fill, with the value for a missing one."""
+  columns = {}
+  for column in model.__table__.columns:
+    if column.name == 'num_upcoming_shows':
+      continue
+    default = column.default.arg if column.default is not None else None
+    columns[column.name] = default
+  return columns
+
+
+def _convert(column, value):
+  if isinstance(column.type, db.Boolean) and isinstance(value, str):
+    return value.strip().lower() in TRUE
+  if isinstance(column.type, db.Integer) and isinstance(value, str):
+    return int(value)
+  if isinstance(column.type, db.DateTime) and isinstance(value, str):
+    value = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    #times with an offset are stored in UTC, those without as they are
+    if value.tzinfo is not None:
+      value = value.astimezone(timezone.utc).replace(tzinfo=None)
+  return value
+
+
+def _genre_names(value):
+  if value in (None, ''):
+    return []
+  if isinstance(value, str):
+    value = value.split(',')
+  if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+    raise Reject(f'bad genres: {value!r}')
+  names = list(dict.fromkeys(name.strip() for name in value if name.strip()))
+  for name in names:
+    if len(name) > Genre.name.type.length:
+      raise Reject(f'genre name too long: {name!r}')
+  return names
+
+
+def _resolve(record, field, names, ids):
+  """
+  Fill record's <field>_id from a <field> name if it wasn't given,
+  and make sure it's the id of an existing row.
+  """
+  key = f'{field}_id'
+  value = record.get(key)
+  if value not in (None, ''):
+    try:
+      id_ = int(value)
+    except (TypeError, ValueError):
+      raise Reject(f'bad {key}: {value!r}')
+    if id_ not in ids:
+      raise Reject(f'no {field} with id {id_}')
+    record[key] = id_
+    return
+  name = record.pop(field, None)
+  if not name:
+    raise Reject(f'no {field} or {key}')
+  id_ = names.get(name.strip().lower())
+  if id_ is None:
+    raise Reject(f'{field} {name!r} is unknown or not unique')
+  record[key] = id_
+
+
+def converter(model):
+  """A function turning a file row into a full row for model's table."""
+  table = model.__table__
+  columns = _columns(model)
+  names = None
+  if model is Show:
+    names = {'venue': name_map(Venue), 'artist': name_map(Artist)}
+
+  def convert(record):
+    record = dict(record)
+    if names:
+      for field, (field_names, ids) in names.items():
+        _resolve(record, field, field_names, ids)
+    row = {}
+    for name, default in columns.items():
+      value = record.get(name)
+      if value in (None, ''):
+        if name == 'id':
+          continue
+        if default is None:
+          raise Reject(f'{name} is required')
+        value = default
+      column = table.c[name]
+      try:
+        row[name] = _convert(column, value)
+      except (TypeError, ValueError) as e:
+        raise Reject(f'bad {name}: {e}')
+      #postgres would fail the whole batch over it
+      length = getattr(column.type, 'length', None)
+      if length is not None and isinstance(row[name], str) and len(row[name]) > length:
+        raise Reject(f'{name} too long, more than {length} characters')
+    if model in GENRE_TABLES:
+      row['genres'] = _genre_names(record.get('genres'))
+    return row
+  return convert
+
+#----------------------------------------------------------------------------#
+# Writing.
+#----------------------------------------------------------------------------#
+
+def _copy_field(value):
+  #COPY's csv format reads an unquoted empty field as NULL, so strings are
+  #always quoted and NULL is written as \N
+  if value is None:
+    return '\\N'
+  if isinstance(value, str):
+    return '"' + value.replace('"', '""') + '"'
+  return str(value)
+
+
+def _copy(table, rows):
+  """Write rows with COPY, through psycopg2's copy_expert."""
+  names = list(rows[0])
+  buffer = io.StringIO()
+  for row in rows:
+    buffer.write(','.join(_copy_field(row[name]) for name in names) + '\n')
+  buffer.seek(0)
+  cursor = db.session.connection().connection.cursor()
+  cursor.copy_expert(
+    f'''COPY "{table.name}" ({", ".join(names)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')''',
+    buffer)
+
+
+def _debug_queries():
+  """
+  The function giving the list of statements Flask-SQLAlchemy keeps for
+  the app context, when debugging or asked to record them.
+  """
+  try:
+    from flask_sqlalchemy import get_debug_queries
+  except ImportError:
+    #3.x renamed it
+    from flask_sqlalchemy.record_queries import get_recorded_queries as get_debug_queries
+  return get_debug_queries
+
+
+def write_batch(table, rows, use_copy):
+  #with and without ids can't share one statement
+  for with_id in (True, False):
+    part = [row for row in rows if ('id' in row) == with_id]
+    if not part:
+      continue
+    if use_copy:
+      _copy(table, part)
+    else:
+      db.session.execute(table.insert(), part)
+
+
+class GenreLinks:
+  """Turns the genre names of venue or artist rows into genre table rows."""
+  def __init__(self, model):
+    self.key = f'{model.__tablename__}_id'
+    self.genre_ids = dict(db.session.query(Genre.name, Genre.id))
+    self.next_id = (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+    self.links = []
+
+  def genre_id(self, name):
+    id_ = self.genre_ids.get(name)
+    if id_ is None:
+      result = db.session.execute(Genre.__table__.insert().values(name=name))
+      id_ = self.genre_ids[name] = result.inserted_primary_key[0]
+    return id_
+
+  def take(self, row):
+    """Give row an id if it has none and keep links for its genres."""
+    names = row.pop('genres')
+    if 'id' not in row:
+      row['id'] = self.next_id
+    self.next_id = max(self.next_id, row['id'] + 1)
+    self.links.extend({self.key: row['id'], 'genre_id': self.genre_id(name)} for name in names)
+
+  def pop(self):
+    links, self.links = self.links, []
+    return links
+
+
+def load(kind, path, format=None, batch_size=5000, rejects=None):
+  """
+  Load the rows of path into the kind ('venues', 'artists' or 'shows')
+  table, committing after each batch.  Returns (loaded, rejected).
+  """
+  model = MODELS[kind]
+  table = model.__table__
+  convert = converter(model)
+  genre_table = GENRE_TABLES.get(model)
+  genres = GenreLinks(model) if genre_table is not None else None
+  use_copy = db.engine.dialect.name == 'postgresql' and db.engine.driver == 'psycopg2'
+  debug_queries = _debug_queries()
+  loaded = rejected = 0
+  gave_ids = False
+  batch = []
+  for line, record in enumerate(read_rows(path, format), 1):
+    try:
+      row = convert(record)
+    except Reject as e:
+      rejected += 1
+      if rejects is not None:
+        rejects.write(json.dumps({'line': line, 'reason': str(e), 'row': record}, default=str) + '\n')
+      continue
+    if genres is not None:
+      genres.take(row)
+    gave_ids = gave_ids or 'id' in row
+    batch.append(row)
+    if len(batch) == batch_size:
+      write_batch(table, batch, use_copy)
+      if genres is not None:
+        write_batch(genre_table, genres.pop(), use_copy)
+      db.session.commit()
+      loaded += len(batch)
+      batch = []
+      #when debugging, Flask-SQLAlchemy keeps every statement and its
+      #parameters until the app context ends, here the end of the load
+      debug_queries().clear()
+  if batch:
+    write_batch(table, batch, use_copy)
+    if genres is not None:
+      write_batch(genre_table, genres.pop(), use_copy)
+    db.session.commit()
+    loaded += len(batch)
+
+  if gave_ids and db.engine.dialect.name == 'postgresql':
+    #rows inserted with their own ids don't move the sequence on
+    db.session.execute(text(
+      f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+      f"(SELECT coalesce(max(id), 1) FROM \"{table.name}\"))"))
+    db.session.commit()
+  if model is Show:
+    counters.refresh_upcoming_counts()
+  if model is Venue:
+    areas.refresh_areas()
+  return loaded, rejected
+
+
+def register_commands(app):
+  @app.cli.command('load-data')
+  @click.argument('kind', type=click.Choice(sorted(MODELS)))
+  @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+  @click.option('--format', type=click.Choice(['csv', 'ndjson']),
+                help='File format, guessed from the extension otherwise.')
+  @click.option('--batch-size', default=5000, show_default=True)
+  @click.option('--rejects', type=click.File('w'),
+                help='Write rows that could not be loaded here, as NDJSON.')
+  def load_data(kind, path, format, batch_size, rejects):
+    """Bulk load venues, artists or shows from a CSV or NDJSON file."""
+    start = time.perf_counter()
+    loaded, rejected = load(kind, path, format, batch_size, rejects)
+    seconds = time.perf_counter() - start
+    click.echo(f'{loaded} {kind} loaded, {rejected} rejected in {seconds:.1f} s '
+               f'({loaded / seconds if seconds else 0:.0f} rows/s)')
+    sys.exit(1 if rejected else 0)
@@ -9,3 +9,26 @@ DEBUG = True
 SQLALCHEMY_DATABASE_URI = 'postgresql://cleverpiggy@localhost:5432/fyyurdb'
 
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Rendered page cache, see pagecache.py
+PAGE_CACHE_ENABLED = True
+PAGE_CACHE_MAX_ENTRIES = 512
+PAGE_CACHE_MAX_BYTES = 32 * 2**20
+PAGE_CACHE_TTL = 300
+
+# Slow statement and N+1 warnings, see querylog.py
+# 'raise' fails a request that repeats a statement too often, 'log' only warns
+QUERY_LOG = 'raise' if DEBUG else 'log'
+QUERY_LOG_SLOW_MS = 100
+QUERY_LOG_REPEAT_LIMIT = 10
+
+# Venue and artist name search, see search_index.py
+SEARCH_FOLD_CASE = True
+SEARCH_FOLD_DIACRITICS = True
+SEARCH_INDEX_TTL = 300
+
+# Database connection pool, see dbengine.py
+# DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+# DB_POOL_PRE_PING and DB_STATEMENT_TIMEOUT_MS can be set here too,
+# environment variables of the same names take precedence
+DB_POOL_LOG_INTERVAL = 60
@@ -1,16 +1,29 @@
 #This module works by calling register_view_funcs(app) in the
 #app.py file.
+#The form views import forms.py themselves, so wtforms is only loaded
+#once someone asks for a form.
 
 import sys
-from flask import render_template, request, flash, redirect, url_for
-from sqlalchemy import func
+from flask import render_template, request, flash, redirect, url_for, abort, \
+                  current_app, stream_with_context, Response, jsonify
 from datetime import datetime
+from sqlalchemy import and_, or_, func
 
-from forms import ArtistForm, VenueForm, ShowForm
-from models import Venue, Artist, Show
+from models import Venue, Artist, Show, Genre, Area
 from db import db
+from pagecache import cached_page, tag_page
+import querylog
+import search_index
 
 
+SHOWS_PER_PAGE = 30
+TYPEAHEAD_LIMIT = 10
+SEARCH_IDS_PER_QUERY = 5000
+AREAS_PER_PAGE = 20
+#the area list shows the first few venues of each area, its own page more
+VENUES_PER_AREA = 10
+VENUES_PER_PAGE = 50
+
 #We'll populate this with tuples of (viewfunc, urlrule, kwargs)
 _views = []
 
@@ -54,24 +67,215 @@ def search_response(search_term, model):
       "num_upcoming_shows": 0,
     }]
   }
+  Names are matched from the start of any of their words, through the
+  in-memory index in search_index.py; only the upcoming show counts of
+  the matches are read from the database.
   """
   response = {"count": 0, "data":[]}
   if search_term:
-    now = datetime.now()
-    future_shows = db.session.query(Show).\
-                              filter(Show.start_time > now).\
-                              subquery()
-    data = db.session.query(model.id,
-                            model.name,
-                            func.count(future_shows.c.start_time).label('num_upcoming_shows')).\
-                      filter(model.name.ilike(f'%{search_term}%')).\
-                      outerjoin(future_shows).\
-                      group_by(model.id)
-    response["count"] = data.count()
-    response["data"] = data.all()
+    ids = [id_ for id_, _ in search_index.search(model, search_term)]
+    rows = {}
+    #a short term can match a lot, keep each IN list a sane length
+    with querylog.batched():
+      for i in range(0, len(ids), SEARCH_IDS_PER_QUERY):
+        rows.update((row.id, row) for row in
+                    db.session.query(model.id, model.name, model.num_upcoming_shows).
+                               filter(model.id.in_(ids[i:i + SEARCH_IDS_PER_QUERY])))
+    #in the index's order, without rows deleted since it last read them
+    data = [rows[id_] for id_ in ids if id_ in rows]
+    response["count"] = len(data)
+    response["data"] = data
   return response
 
 
+def typeahead_response(model):
+  """
+  JSON of the first names matching the 'q' request arg, for suggesting
+  names as the user types:
+  {"count": 1, "data": [{"id": 4, "name": "Guns N Petals"}]}
+  """
+  limit = request.args.get('limit', TYPEAHEAD_LIMIT, type=int)
+  if not 0 < limit <= 100:
+    abort(400)
+  matches = search_index.search(model, request.args.get('q', ''), limit)
+  return jsonify(count=len(matches), data=[{"id": id_, "name": name} for id_, name in matches])
+
+
+def month_range(month):
+  """
+  Return the first moment of a 'YYYY-MM' month and of the month after,
+  raising ValueError if it isn't one.
+  """
+  start = datetime.strptime(month, '%Y-%m')
+  if start.month == 12:
+    return start, start.replace(year=start.year + 1, month=1)
+  return start, start.replace(month=start.month + 1)
+
+
+def shows_query(args):
+  """
+  Return the shows listing query, in start time order, filtered by the
+  'when' (upcoming or past) and 'month' request args.
+  Aborts with 400 on values it doesn't understand.
+  """
+  query = db.session.query(
+    Show.venue_id,
+    Show.artist_id,
+    Show.start_time,
+    Artist.name.label('artist_name'),
+    Venue.name.label('venue_name'),
+    Artist.image_link.label('artist_image_link')
+    ).join(Artist, Venue).\
+      order_by(Show.start_time, Show.id)
+
+  when = args.get('when')
+  if when == 'upcoming':
+    query = query.filter(Show.start_time > datetime.now())
+  elif when == 'past':
+    query = query.filter(Show.start_time <= datetime.now())
+  elif when is not None:
+    abort(400)
+
+  month = args.get('month')
+  if month is not None:
+    try:
+      start, end = month_range(month)
+    except ValueError:
+      abort(400)
+    query = query.filter(Show.start_time >= start, Show.start_time < end)
+  return query
+
+
+def stream_template(template_name, **context):
+  """
+  Render a template a piece at a time as the response is sent, so the
+  first bytes go out while a query the template loops over is still
+  being read. Flask only has this built in from 2.2.
+  """
+  app = current_app._get_current_object()
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  return Response(stream_with_context(template.generate(context)))
+
+
+def detail_page_data(model, id_):
+  """
+  Return the data for a venue or artist page, None if there is no such id.
+  The row and all of its shows, with the name and image of the artist
+  (or venue) playing them, come back in a single query; splitting past
+  from upcoming and counting them is done here.
+  """
+  other = {Venue: Artist, Artist: Venue}[model]
+  prefix = other.__tablename__
+  other_id = getattr(Show, f'{prefix}_id')
+  rows = db.session.query(model,
+                          other_id,
+                          Show.start_time,
+                          other.name.label(f'{prefix}_name'),
+                          other.image_link.label(f'{prefix}_image_link')).\
+                    outerjoin(model.shows).\
+                    outerjoin(other, other.id == other_id).\
+                    filter(model.id == id_).\
+                    order_by(Show.start_time).\
+                    all()
+  if not rows:
+    return None
+
+  now = datetime.now()
+  past_shows, upcoming_shows = [], []
+  for row in rows:
+    show = row._asdict()
+    show.pop(model.__name__)
+    #a row without shows still comes back once from the outer join
+    if show['start_time'] is None:
+      continue
+    if show['start_time'] < now:
+      past_shows.append(show)
+    elif show['start_time'] > now:
+      upcoming_shows.append(show)
+
+  data = dictify(rows[0][0])
+  data["past_shows_count"] = len(past_shows)
+  data["upcoming_shows_count"] = len(upcoming_shows)
+  data["past_shows"] = past_shows
+  data["upcoming_shows"] = upcoming_shows
+  data["genres"] = [genre.name for genre in rows[0][0].genres]
+  return data
+
+
+def venue_dict(row):
+  return {"id": row.id, "name": row.name, "num_upcoming_shows": row.num_upcoming_shows}
+
+
+def area_dict(area, venues):
+  return {"city": area.city, "state": area.state, "num_venues": area.num_venues, "venues": venues}
+
+
+def area_list_page(page):
+  """
+  Return (areas, whether there are more) for a page of the area list,
+  each area with its first VENUES_PER_AREA venues by name.
+  """
+  areas = Area.query.filter(Area.num_venues > 0).\
+                     order_by(Area.state, Area.city).\
+                     offset((page - 1) * AREAS_PER_PAGE).\
+                     limit(AREAS_PER_PAGE + 1).\
+                     all()
+  more = len(areas) > AREAS_PER_PAGE
+  areas = areas[:AREAS_PER_PAGE]
+  if not areas:
+    return [], more
+  #number each area's venues by name in one query, keeping the first few
+  rank = func.row_number().over(partition_by=(Venue.state, Venue.city),
+                                order_by=(Venue.name, Venue.id)).label('rank')
+  ranked = db.session.query(Venue.id, Venue.name, Venue.state, Venue.city,
+                            Venue.num_upcoming_shows, rank).\
+                      filter(or_(*(and_(Venue.state == area.state, Venue.city == area.city)
+                                   for area in areas))).\
+                      subquery()
+  venues = {}
+  for row in db.session.query(ranked).\
+                        filter(ranked.c.rank <= VENUES_PER_AREA).\
+                        order_by(ranked.c.rank):
+    venues.setdefault((row.state, row.city), []).append(venue_dict(row))
+  return [area_dict(area, venues.get((area.state, area.city), [])) for area in areas], more
+
+
+def area_page(state, city, page):
+  """Return ([the area], whether there are more) for a page of one area's venues."""
+  area = Area.query.filter_by(state=state, city=city).\
+                    filter(Area.num_venues > 0).\
+                    first_or_404()
+  rows = db.session.query(Venue.id, Venue.name, Venue.num_upcoming_shows).\
+                    filter_by(state=state, city=city).\
+                    order_by(Venue.name, Venue.id).\
+                    offset((page - 1) * VENUES_PER_PAGE).\
+                    limit(VENUES_PER_PAGE + 1).\
+                    all()
+  venues = [venue_dict(row) for row in rows[:VENUES_PER_PAGE]]
+  return [area_dict(area, venues)], len(rows) > VENUES_PER_PAGE
+
+
+def genre_areas(genre):
+  """Every venue with genre, grouped by area."""
+  query = db.session.query(
+    Venue.name,
+    Venue.city,
+    Venue.state,
+    Venue.id,
+    Venue.num_upcoming_shows).\
+                     join(Venue.genres).\
+                     filter(Genre.name == genre).\
+                     order_by(Venue.state, Venue.city, Venue.name)
+  areas = []
+  for row in query:
+    if not areas or (areas[-1]["state"], areas[-1]["city"]) != (row.state, row.city):
+      areas.append({"city": row.city, "state": row.state, "num_venues": 0, "venues": []})
+    areas[-1]["venues"].append(venue_dict(row))
+    areas[-1]["num_venues"] += 1
+  return areas
+
+
 def create_submission(model):
   modelname = model.__tablename__.upper()
   seeking_label = {Venue: 'seeking_talent', Artist: 'seeking_venue'}[model]
@@ -79,8 +283,7 @@ def create_submission(model):
   try:
     #necessary because request.form may have multiple key/values
     #for genres
-    genres = request.form.getlist('genres')
-    genres = ','.join(genres)
+    genres = Genre.named(request.form.getlist('genres'))
     fields = dict(request.form)
     fields.pop('genres')
     fields[seeking_label] = bool(fields.get(seeking_label))
@@ -132,35 +335,34 @@ def index():
 #----------------------------------------------------------------
 
 @route('/venues')
+@cached_page('venues')
 def venues():
-#returns a list of venues each with .city, .state, .id, .name attrs, num_upcoming_shows
-  now = datetime.now()
-  future_shows = Show.query.filter(Show.start_time > now).subquery()
-  query = db.session.query(
-    Venue.name,
-    Venue.city,
-    Venue.state,
-    Venue.id,
-    func.count(future_shows.c.start_time).label('num')).\
-                     outerjoin(future_shows).\
-                     group_by(Venue.id).\
-                     order_by(Venue.state, Venue.city)
-  #get the data in the correct format
-  areas = []
-  c, s = None, None
-  for name, city, state, id_, num in query.all():
-    if (city, state) == (c, s):
-        areas[-1]["venues"].append({"id": id_, "name": name, "num_upcoming_shows": num})
-    else:
-        c, s = city, state
-        area = {
-            "city": city,
-            "state": state,
-            "venues": [{"id": id_, "name": name, "num_upcoming_shows": num}]
-        }
-        areas.append(area)
+#areas a page at a time (?page=N) with the first few venues of each, from
+#the area table kept by areas.py. ?state=CA&city=San Francisco pages
+#through one area's venues, ?genre=Jazz lists every venue with that genre
+  genre = request.args.get('genre')
+  if genre:
+    return render_template('pages/venues.html', areas=genre_areas(genre), genre=genre)
+
+  page = request.args.get('page', 1, type=int)
+  if page < 1:
+    abort(400)
+  state, city = request.args.get('state'), request.args.get('city')
+  if state is None and city is None:
+    areas, more = area_list_page(page)
+  elif state and city:
+    areas, more = area_page(state, city, page)
+  else:
+    abort(400)
 
-  return render_template('pages/venues.html', areas=areas);
+  args = request.args.to_dict()
+  prev_url = next_url = None
+  if page > 1:
+    prev_url = url_for('venues', **dict(args, page=page - 1))
+  if more:
+    next_url = url_for('venues', **dict(args, page=page + 1))
+  return render_template('pages/venues.html', areas=areas, one_area=bool(state),
+                         prev_url=prev_url, next_url=next_url)
 
 
 @route('/venues/search', methods=['POST'])
@@ -170,25 +372,20 @@ def search_venues():
   return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 
+@route('/venues/typeahead')
+def typeahead_venues():
+  return typeahead_response(Venue)
+
+
 @route('/venues/<int:venue_id>')
+@cached_page('venue:{venue_id}')
 def show_venue(venue_id):
-  now = datetime.now()
-  venue = Venue.query.get(venue_id)
-  shows = db.session.query(Show.artist_id,
-                           Show.start_time,
-                           Artist.name.label('artist_name'),
-                           Artist.image_link.label('artist_image_link')).\
-                     join(Artist).\
-                     filter(Show.venue_id == venue_id)
-
-  past_shows = shows.filter(Show.start_time < now)
-  upcoming_shows = shows.filter(Show.start_time > now)
-  data = dictify(venue)
-  data["past_shows_count"] = past_shows.count()
-  data["upcoming_shows_count"] = upcoming_shows.count()
-  data["past_shows"] = past_shows.all()
-  data["upcoming_shows"] = upcoming_shows.all()
-  data["genres"] = data["genres"].split(',')
+  data = detail_page_data(Venue, venue_id)
+  if data is None:
+    abort(404)
+  #the page shows the name and image of each artist playing
+  shows = data['past_shows'] + data['upcoming_shows']
+  tag_page(*(f'artist:{show["artist_id"]}' for show in shows))
 
   return render_template('pages/show_venue.html', venue=data)
 
@@ -198,6 +395,7 @@ def show_venue(venue_id):
 
 @route('/venues/create', methods=['GET'])
 def create_venue_form():
+  from forms import VenueForm
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
@@ -216,10 +414,16 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 
 @route('/artists')
+@cached_page('artists')
 def artists():
-  data = db.session.query(Artist.id, Artist.name).all()
+#?genre=Jazz lists only the artists with that genre
+  genre = request.args.get('genre')
+  query = db.session.query(Artist.id, Artist.name)
+  if genre:
+    query = query.join(Artist.genres).filter(Genre.name == genre)
+  data = query.all()
 
-  return render_template('pages/artists.html', artists=data)
+  return render_template('pages/artists.html', artists=data, genre=genre)
 
 
 @route('/artists/search', methods=['POST'])
@@ -229,25 +433,20 @@ def search_artists():
   return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 
+@route('/artists/typeahead')
+def typeahead_artists():
+  return typeahead_response(Artist)
+
+
 @route('/artists/<int:artist_id>')
+@cached_page('artist:{artist_id}')
 def show_artist(artist_id):
-  now = datetime.now()
-  artist = Artist.query.get(artist_id)
-  shows = db.session.query(Show.venue_id,
-                           Show.start_time,
-                           Venue.name.label('venue_name'),
-                           Venue.image_link.label('venue_image_link')).\
-                     join(Venue).\
-                     filter(Show.artist_id == artist_id)
-
-  past_shows = shows.filter(Show.start_time < now)
-  upcoming_shows = shows.filter(Show.start_time > now)
-  data = dictify(artist)
-  data["past_shows_count"] = past_shows.count()
-  data["upcoming_shows_count"] = upcoming_shows.count()
-  data["past_shows"] = past_shows.all()
-  data["upcoming_shows"] = upcoming_shows.all()
-  data["genres"] = data["genres"].split(',')
+  data = detail_page_data(Artist, artist_id)
+  if data is None:
+    abort(404)
+  #the page shows the name and image of each venue playing
+  shows = data['past_shows'] + data['upcoming_shows']
+  tag_page(*(f'venue:{show["venue_id"]}' for show in shows))
 
   return render_template('pages/show_artist.html', artist=data)
 
@@ -256,10 +455,11 @@ def show_artist(artist_id):
 
 @route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
+  from forms import ArtistForm
   form = ArtistForm()
   row = Artist.query.get(artist_id)
   artist = dictify(row)
-  artist['genres'] = artist['genres'].split(',')
+  artist['genres'] = [genre.name for genre in row.genres]
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
@@ -270,8 +470,7 @@ def edit_artist_submission(artist_id):
     artist = Artist.query.get(artist_id)
     #necessary because request.form may have multiple key/values
     #for genres
-    genres = request.form.getlist('genres')
-    artist.genres = ','.join(genres)
+    artist.genres = Genre.named(request.form.getlist('genres'))
     #an unchecked box doesnt appear in reqest.form so this is necessary
     artist.seeking_venue = bool(request.form.get('seeking_venue'))
     for k, v in request.form.items():
@@ -293,10 +492,11 @@ def edit_artist_submission(artist_id):
 
 @route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
+  from forms import VenueForm
   form = VenueForm()
   row = Venue.query.get(venue_id)
   venue = dictify(row)
-  venue['genres'] = venue['genres'].split(',')
+  venue['genres'] = [genre.name for genre in row.genres]
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
@@ -307,8 +507,7 @@ def edit_venue_submission(venue_id):
     venue = Venue.query.get(venue_id)
     #necessary because request.form may have multiple key/values
     #for genres
-    genres = request.form.getlist('genres')
-    venue.genres = ','.join(genres)
+    venue.genres = Genre.named(request.form.getlist('genres'))
     #an unchecked box doesnt appear in reqest.form so this is necessary
     venue.seeking_talent = bool(request.form.get('seeking_talent'))
 
@@ -334,6 +533,7 @@ def edit_venue_submission(venue_id):
 
 @route('/artists/create', methods=['GET'])
 def create_artist_form():
+  from forms import ArtistForm
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
@@ -353,22 +553,34 @@ def delete_artist(artist_id):
 #  ----------------------------------------------------------------
 
 @route('/shows')
+@cached_page('shows')
 def shows():
-  now = datetime.now()
-  data = db.session.query(
-    Show.venue_id,
-    Show.artist_id,
-    Show.start_time,
-    Artist.name.label('artist_name'),
-    Venue.name.label('venue_name'),
-    Artist.image_link.label('artist_image_link')
-    ).join(Artist, Venue)
-  return render_template('pages/shows.html', shows=data)
+#?when=upcoming|past and ?month=YYYY-MM narrow the listing, ?page=N pages it.
+#?stream=1 sends every matching show as the page renders, for big exports.
+  query = shows_query(request.args)
+  if request.args.get('stream'):
+    return stream_template('pages/shows.html', shows=query.yield_per(500))
+
+  page = request.args.get('page', 1, type=int)
+  if page < 1:
+    abort(400)
+  #one extra row tells us if there is a next page without counting them all
+  data = query.offset((page - 1) * SHOWS_PER_PAGE).limit(SHOWS_PER_PAGE + 1).all()
+  args = request.args.to_dict()
+  prev_url = next_url = None
+  if page > 1:
+    prev_url = url_for('shows', **dict(args, page=page - 1))
+  if len(data) > SHOWS_PER_PAGE:
+    data = data[:SHOWS_PER_PAGE]
+    next_url = url_for('shows', **dict(args, page=page + 1))
+  return render_template('pages/shows.html', shows=data,
+                         prev_url=prev_url, next_url=next_url)
 
 
 @route('/shows/create')
 def create_shows():
   # renders form. do not touch.
+  from forms import ShowForm
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
@@ -0,0 +1,142 @@
+#Venue.num_upcoming_shows and Artist.num_upcoming_shows are denormalized
+#counts of shows that haven't started yet, so the venue listing and the
+#search pages can read them instead of aggregating the show table.
+#
+#They are kept current two ways:
+#  * ORM events on Show adjust them as shows are added, moved or deleted.
+#  * Shows starting is not an event, so `flask refresh-upcoming` recounts
+#    them. Run it from cron every few minutes; in between, a show that
+#    has just started is still counted as upcoming.
+#`flask check-upcoming` compares them with the live aggregate.
+#Anything writing the show table without the ORM should run the refresh.
+
+import sys
+from datetime import datetime
+
+import click
+from sqlalchemy import event, func, bindparam
+from sqlalchemy.orm.attributes import get_history
+
+from models import Venue, Artist, Show
+from db import db
+
+
+COUNTED = (Venue, Artist)
+
+
+def _show_fk(model):
+  return getattr(Show, f'{model.__tablename__}_id')
+
+#----------------------------------------------------------------------------#
+# Show events.
+#----------------------------------------------------------------------------#
+
+def _adjust(connection, model, id_, n):
+  table = model.__table__
+  connection.execute(
+    table.update().
+          where(table.c.id == id_).
+          values(num_upcoming_shows=table.c.num_upcoming_shows + n)
+  )
+
+
+def _adjust_for(connection, venue_id, artist_id, start_time, n):
+  if start_time is not None and start_time > datetime.now():
+    _adjust(connection, Venue, venue_id, n)
+    _adjust(connection, Artist, artist_id, n)
+
+
+@event.listens_for(Show, 'after_insert')
+def _show_inserted(mapper, connection, show):
+  _adjust_for(connection, show.venue_id, show.artist_id, show.start_time, 1)
+
+
+@event.listens_for(Show, 'after_delete')
+def _show_deleted(mapper, connection, show):
+  _adjust_for(connection, show.venue_id, show.artist_id, show.start_time, -1)
+
+
+#an active_history listener makes setting these load the old value first,
+#otherwise an expired show's history has nothing to take back
+@event.listens_for(Show.venue_id, 'set', active_history=True)
+@event.listens_for(Show.artist_id, 'set', active_history=True)
+@event.listens_for(Show.start_time, 'set', active_history=True)
+def _load_old_value(show, value, oldvalue, initiator):
+  pass
+
+
+@event.listens_for(Show, 'after_update')
+def _show_updated(mapper, connection, show):
+  old, new = {}, {}
+  for attr in ('venue_id', 'artist_id', 'start_time'):
+    history = get_history(show, attr)
+    new[attr] = getattr(show, attr)
+    old[attr] = history.deleted[0] if history.deleted else new[attr]
+  if old != new:
+    _adjust_for(connection, n=-1, **old)
+    _adjust_for(connection, n=1, **new)
+
+#----------------------------------------------------------------------------#
+# Refresh and check.
+#----------------------------------------------------------------------------#
+
+def refresh_upcoming_counts(now=None):
+  """
+  Recount every stored count from one GROUP BY over the upcoming shows,
+  writing only the rows that changed.
+  """
+  now = now or datetime.now()
+  for model in COUNTED:
+    fk = _show_fk(model)
+    live = dict(db.session.query(fk, func.count(Show.id)).
+                           filter(Show.start_time > now).
+                           group_by(fk))
+    changed = [
+      {'id_': id_, 'count': live.get(id_, 0)}
+      for id_, stored in db.session.query(model.id, model.num_upcoming_shows)
+      if stored != live.get(id_, 0)
+    ]
+    if changed:
+      table = model.__table__
+      db.session.execute(
+        table.update().
+              where(table.c.id == bindparam('id_')).
+              values(num_upcoming_shows=bindparam('count')),
+        changed
+      )
+  db.session.commit()
+
+
+def check_upcoming_counts(now=None):
+  """
+  Return (model name, id, stored, actual) for every venue and artist
+  whose stored count disagrees with the show table.
+  """
+  now = now or datetime.now()
+  wrong = []
+  for model in COUNTED:
+    future_shows = Show.query.filter(Show.start_time > now).subquery()
+    actual = func.count(future_shows.c.id)
+    query = db.session.query(model.id, model.num_upcoming_shows, actual).\
+                       outerjoin(future_shows, future_shows.c[f'{model.__tablename__}_id'] == model.id).\
+                       group_by(model.id).\
+                       having(model.num_upcoming_shows != actual).\
+                       order_by(model.id)
+    wrong.extend((model.__name__, *row) for row in query)
+  return wrong
+
+
+def register_commands(app):
+  @app.cli.command('refresh-upcoming')
+  def refresh_upcoming():
+    """Recount the upcoming shows of every venue and artist."""
+    refresh_upcoming_counts()
+
+  @app.cli.command('check-upcoming')
+  def check_upcoming():
+    """List venues and artists whose upcoming show count is wrong."""
+    wrong = check_upcoming_counts()
+    for name, id_, stored, actual in wrong:
+      click.echo(f'{name} {id_}: stored {stored}, actually {actual}')
+    click.echo(f'{len(wrong)} wrong')
+    sys.exit(1 if wrong else 0)
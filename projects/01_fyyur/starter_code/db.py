@@ -1,3 +1,65 @@
+from time import perf_counter
+
+from flask import g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 db = SQLAlchemy()
+
+
+#Functions called with (statement, parameters, seconds) after every
+#statement that completes, so querylog needn't time them again.
+statement_listeners = []
+
+
+#Counts and times every statement sent to the database during a request.
+#Listening on the Engine class catches whatever engine the app ends up with.
+#The start time is kept on the statement's execution context, so one
+#that fails doesn't leave it behind.
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+  if context is not None:
+    context.query_start = perf_counter()
+  if has_request_context():
+    g.query_count = g.get('query_count', 0) + 1
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _time_query(conn, cursor, statement, parameters, context, executemany):
+  start = getattr(context, 'query_start', None)
+  if start is None:
+    return
+  seconds = perf_counter() - start
+  if has_request_context():
+    g.query_seconds = g.get('query_seconds', 0.0) + seconds
+  for listener in statement_listeners:
+    listener(statement, parameters, seconds)
+
+
+def query_count():
+  """Number of SQL statements the current request has run so far."""
+  return g.get('query_count', 0)
+
+
+def sql_stats():
+  """(statements, seconds spent in them) for the current request so far."""
+  return query_count(), g.get('query_seconds', 0.0)
+
+
+def init_query_counter(app):
+  """
+  Start each request's count at zero, and when debugging or testing
+  report it in an X-Query-Count response header so a test can assert
+  on how many queries a page costs.
+  """
+  @app.before_request
+  def reset_query_count():
+    g.query_count = 0
+    g.query_seconds = 0.0
+
+  @app.after_request
+  def query_count_header(response):
+    if app.debug or app.testing:
+      response.headers['X-Query-Count'] = str(query_count())
+    return response
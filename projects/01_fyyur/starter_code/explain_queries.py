@@ -0,0 +1,162 @@
+#Shows how the database runs the queries behind each page.
+#
+#Requests the listings, searches and detail pages through the Flask test
+#client, catching every SELECT they send, then runs EXPLAIN (EXPLAIN QUERY
+#PLAN on sqlite) on each with the same parameters and prints the plans.
+#The upcoming show check and refresh from counters.py are explained too,
+#which means running the refresh.
+#
+#Full scans of the venue, artist or show tables are listed at the end.
+#The counters read every venue and artist, so scan by design, and so
+#does the first search, which reads every name into search_index.py.
+#Anything else scanning probably means an index is missing or unusable.
+#
+#usage:
+#  python explain_queries.py                        the database in config.py
+#  python explain_queries.py --db sqlite:///fyyur.db
+#
+#Run it against a database of realistic size (loadtest.py --db fills one),
+#planners happily scan small tables whatever indexes there are.
+
+import argparse
+import re
+import sys
+from urllib.parse import quote
+
+from sqlalchemy import event
+
+from querylog import statement_shape
+
+SCANNED_TABLES = ('venue', 'artist', 'show')
+_full_scan = re.compile(r'Seq Scan on (\w+)|^SCAN (?:TABLE )?(\w+)(?!.* USING )')
+
+
+def pages(venue_id, artist_id, month, genre, area):
+  """label: (method, url, form data)"""
+  return {
+    'venues': ('GET', '/venues', None),
+    'venues in an area': ('GET', f'/venues?state={quote(area[0])}&city={quote(area[1])}', None),
+    'artists': ('GET', '/artists', None),
+    'venues by genre': ('GET', f'/venues?genre={quote(genre)}', None),
+    'artists by genre': ('GET', f'/artists?genre={quote(genre)}', None),
+    'shows': ('GET', '/shows', None),
+    'shows upcoming': ('GET', '/shows?when=upcoming&page=3', None),
+    'shows by month': ('GET', f'/shows?month={month}', None),
+    'venue search': ('POST', '/venues/search', {'search_term': 'hall'}),
+    'artist search': ('POST', '/artists/search', {'search_term': 'davis'}),
+    'venue page': ('GET', f'/venues/{venue_id}', None),
+    'artist page': ('GET', f'/artists/{artist_id}', None),
+  }
+
+
+class Catcher:
+  """Keeps the SELECTs sent while it's on, each once."""
+  def __init__(self, engine):
+    self.statements = []
+    self.on = False
+    event.listen(engine, 'before_cursor_execute', self._catch)
+
+  def _catch(self, conn, cursor, statement, parameters, context, executemany):
+    if self.on and not executemany and statement.lstrip().upper().startswith('SELECT'):
+      if all(statement != caught for caught, _ in self.statements):
+        self.statements.append((statement, parameters))
+
+  def catch(self, run):
+    self.statements, self.on = [], True
+    try:
+      run()
+    finally:
+      self.on = False
+    return self.statements
+
+
+def explain(engine, statement, parameters):
+  """The plan as a list of lines."""
+  prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+  connection = engine.raw_connection()
+  try:
+    cursor = connection.cursor()
+    cursor.execute(prefix + statement, parameters)
+    rows = cursor.fetchall()
+  finally:
+    connection.close()
+  if engine.dialect.name == 'sqlite':
+    #(id, parent, notused, detail)
+    return [row[-1] for row in rows]
+  return [row[0] for row in rows]
+
+
+def full_scans(plan):
+  scanned = set()
+  for line in plan:
+    match = _full_scan.search(line.strip())
+    if match:
+      table = (match.group(1) or match.group(2)).strip('"')
+      if table in SCANNED_TABLES:
+        scanned.add(table)
+  return scanned
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='EXPLAIN the queries behind the Fyyur pages.')
+  parser.add_argument('--db', help='database url, the one in config.py by default')
+  args = parser.parse_args(argv)
+
+  from app import create_app
+  from db import db
+  from models import Venue, Artist, Show, Genre, Area
+  import counters
+  import pagecache
+  settings = {'TESTING': True, 'INSTRUMENT_LOG': False, 'QUERY_LOG': 'off'}
+  if args.db:
+    settings['SQLALCHEMY_DATABASE_URI'] = args.db
+  app = create_app(migrate=False, **settings)
+  pagecache.page_cache.enabled = False
+
+  with app.app_context():
+    engine = db.engine
+    #the busiest venue and artist, whose pages cost the most
+    venue_id = db.session.query(Venue.id).order_by(Venue.num_upcoming_shows.desc()).limit(1).scalar()
+    artist_id = db.session.query(Artist.id).order_by(Artist.num_upcoming_shows.desc()).limit(1).scalar()
+    first = db.session.query(Show.start_time).order_by(Show.start_time).limit(1).scalar()
+    month = first.strftime('%Y-%m') if first else '2020-01'
+    genre = db.session.query(Genre.name).order_by(Genre.id).limit(1).scalar() or 'Jazz'
+    area = db.session.query(Area.state, Area.city).order_by(Area.num_venues.desc()).first()
+    db.session.remove()
+  if venue_id is None or artist_id is None or area is None:
+    print('the database has no venues or artists to explain pages for')
+    return 1
+
+  catcher = Catcher(engine)
+  client = app.test_client()
+  caught = {}
+  for label, (method, url, data) in pages(venue_id, artist_id, month, genre, area).items():
+    caught[f'{label}  {method} {url}'] = catcher.catch(
+      lambda: client.open(url, method=method, data=data).get_data())
+  with app.app_context():
+    caught['flask check-upcoming'] = catcher.catch(counters.check_upcoming_counts)
+    #this does refresh the counts, as the cron job would
+    caught['flask refresh-upcoming'] = catcher.catch(counters.refresh_upcoming_counts)
+
+  scans = []
+  for label, statements in caught.items():
+    print(f'=== {label}')
+    scanned = set()
+    for statement, parameters in statements:
+      plan = explain(engine, statement, parameters)
+      print(statement_shape(statement))
+      for line in plan:
+        print('  ', line)
+      print()
+      scanned |= full_scans(plan)
+    if scanned:
+      scans.append(f'{label}: {", ".join(sorted(scanned))}')
+
+  print('full table scans:')
+  for line in scans or ['none']:
+    print('  ', line)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
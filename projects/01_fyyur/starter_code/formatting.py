@@ -0,0 +1,61 @@
+#The datetime template filter.
+#
+#  {{ show.start_time|datetime('full') }}
+#
+#The 'full' and 'medium' patterns are parsed once, here, and the locale
+#looked up once, instead of on every call.  Strings are read with
+#datetime.fromisoformat when they are ISO 8601, which is what the app
+#stores and sends, and only go through dateutil's parser otherwise.
+#Results are kept in a bounded LRU, since a page of shows repeats the
+#same few evening start times over and over.
+#babel and dateutil are imported on first use, not when the app starts.
+
+from datetime import datetime, timezone
+from functools import lru_cache
+
+PATTERNS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+CACHE_SIZE = 16384
+
+_compiled = {}
+_locale = None
+
+
+def _pattern(format):
+  """The parsed babel pattern for a name in PATTERNS, None for others."""
+  global _locale
+  if format not in _compiled:
+    if format not in PATTERNS:
+      return None
+    import babel.dates
+    _locale = babel.Locale.parse(babel.dates.LC_TIME)
+    _compiled[format] = babel.dates.parse_pattern(PATTERNS[format])
+  return _compiled[format]
+
+
+def parse_datetime(value):
+  """value as a datetime, from a datetime or a date string."""
+  if isinstance(value, datetime):
+    return value
+  try:
+    #fromisoformat doesn't take a trailing Z before python 3.11
+    return datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+  except ValueError:
+    import dateutil.parser
+    return dateutil.parser.parse(value)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def format_datetime(value, format='medium'):
+  date = parse_datetime(value)
+  pattern = _pattern(format)
+  if pattern is None:
+    #anything else is a babel format name ('short', 'long') or pattern
+    import babel.dates
+    return babel.dates.format_datetime(date, format)
+  #babel reads naive datetimes as UTC
+  if date.tzinfo is None:
+    date = date.replace(tzinfo=timezone.utc)
+  return pattern.apply(date, _locale)
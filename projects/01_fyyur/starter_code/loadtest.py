@@ -0,0 +1,297 @@
+#Load test for the Fyyur pages.
+#
+#Fills a database with synthetic venues, artists and shows, then requests
+#the listings, searches and detail pages through the Flask test client
+#and reports p50/p95/p99 response times and queries per request.
+#Everything random is seeded, so runs at the same scale ask for the same
+#pages and can be compared.
+#
+#Shows are spread over the last two years and the next one, mostly on
+#Friday and Saturday evenings, and a few popular venues and artists get
+#most of them.
+#
+#usage:
+#  python loadtest.py                          1k venues, 10k artists, 100k shows
+#  python loadtest.py --venues 10000 --artists 100000 --shows 1000000
+#  python loadtest.py --save                   store the results as the baseline
+#  python loadtest.py --compare                exit 1 if slower than the baseline
+#
+#The database is a throwaway sqlite file unless --db gives a url; with
+#--reuse an already filled database is used as it is.  The page cache is
+#off unless --cache, so pages are rendered every time.
+
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from random import Random
+from urllib.parse import quote
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'loadtest_baseline.json')
+BATCH = 10000
+
+CITIES = [
+  ('New York', 'NY', 20), ('Los Angeles', 'CA', 15), ('Chicago', 'IL', 10),
+  ('San Francisco', 'CA', 8), ('Austin', 'TX', 8), ('Nashville', 'TN', 8),
+  ('Seattle', 'WA', 6), ('New Orleans', 'LA', 6), ('Denver', 'CO', 5),
+  ('Atlanta', 'GA', 5), ('Boston', 'MA', 5), ('Portland', 'OR', 4),
+  ('Minneapolis', 'MN', 3), ('Detroit', 'MI', 3), ('Memphis', 'TN', 3),
+  ('Philadelphia', 'PA', 4), ('Miami', 'FL', 4), ('Phoenix', 'AZ', 2),
+]
+GENRES = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk',
+          'Funk', 'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre',
+          'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul', 'Other']
+ADJECTIVES = ['Blue', 'Velvet', 'Golden', 'Rusty', 'Electric', 'Crooked', 'Lucky',
+              'Silver', 'Hidden', 'Neon', 'Broken', 'Wild', 'Midnight', 'Painted']
+NOUNS = ['Note', 'Room', 'Lantern', 'Anchor', 'Cellar', 'Parlor', 'Garage', 'Owl',
+         'Barrel', 'Hall', 'Stage', 'Tavern', 'Lounge', 'Attic']
+FIRST = ['Ada', 'Billie', 'Cass', 'Dizzy', 'Etta', 'Fats', 'Gram', 'Hank', 'Iggy',
+         'Janis', 'Kurt', 'Lena', 'Miles', 'Nina', 'Otis', 'Patsy', 'Ray', 'Sade']
+LAST = ['Adams', 'Baker', 'Cole', 'Davis', 'Evans', 'Fisher', 'Green', 'Holiday',
+        'Irwin', 'James', 'King', 'Lewis', 'Monk', 'Nash', 'Owens', 'Parker']
+SEARCH_TERMS = ['blue', 'the', 'owl', 'hall 1', 'davis', 'ada', 'nina p', 'zz']
+
+#Friday and Saturday are the busy nights
+WEEKDAY_WEIGHT = [1, 1, 1.5, 2, 4, 4, 2]
+
+#----------------------------------------------------------------------------#
+# Data.
+#----------------------------------------------------------------------------#
+
+def popularity(rand, n):
+  """Cumulative weights for picking ids 1..n, a few of them very often."""
+  total, cumulative = 0, []
+  for _ in range(n):
+    total += rand.paretovariate(1.2)
+    cumulative.append(total)
+  return cumulative
+
+
+def place(rand, i):
+  city, state, _ = rand.choices(CITIES, weights=[c[2] for c in CITIES])[0]
+  return {
+    'city': city,
+    'state': state,
+    'phone': f'{rand.randint(200, 999)}-555-{i % 10000:04d}',
+    #ids of GENRES, which get ids 1.. in order
+    'genre_ids': rand.sample(range(1, len(GENRES) + 1), rand.randint(1, 3)),
+  }
+
+
+def venue_rows(rand, n):
+  for i in range(1, n + 1):
+    name = f'The {rand.choice(ADJECTIVES)} {rand.choice(NOUNS)} {i}'
+    yield dict(place(rand, i), id=i, name=name, address=f'{rand.randint(1, 9999)} Main St',
+               seeking_talent=rand.random() < 0.3)
+
+
+def artist_rows(rand, n):
+  for i in range(1, n + 1):
+    name = f'{rand.choice(FIRST)} {rand.choice(LAST)} {i}'
+    yield dict(place(rand, i), id=i, name=name, seeking_venue=rand.random() < 0.3)
+
+
+def show_rows(rand, n, venues, artists, now):
+  venue_weights = popularity(rand, venues)
+  artist_weights = popularity(rand, artists)
+  venue_ids = range(1, venues + 1)
+  artist_ids = range(1, artists + 1)
+  today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+  done = 0
+  while done < n:
+    k = min(BATCH, n - done)
+    venue_batch = rand.choices(venue_ids, cum_weights=venue_weights, k=k)
+    artist_batch = rand.choices(artist_ids, cum_weights=artist_weights, k=k)
+    for venue_id, artist_id in zip(venue_batch, artist_batch):
+      while True:
+        day = today + timedelta(days=rand.randint(-730, 365))
+        if rand.random() * 4 < WEEKDAY_WEIGHT[day.weekday()]:
+          break
+      #evening slots on the half hour, most around 9pm
+      slot = min(max(round(rand.gauss(42, 3)), 36), 47)
+      yield {'venue_id': venue_id, 'artist_id': artist_id,
+             'start_time': day + timedelta(minutes=30 * slot)}
+    done += k
+
+
+def insert_batches(table, rows, genre_table=None):
+  """Insert rows, and their genre_ids into genre_table if given."""
+  from db import db
+  key = f'{table.name}_id'
+  batch, links = [], []
+  for row in rows:
+    if genre_table is not None:
+      links.extend({key: row['id'], 'genre_id': id_} for id_ in row.pop('genre_ids'))
+    batch.append(row)
+    if len(batch) == BATCH:
+      db.session.execute(table.insert(), batch)
+      batch = []
+  if batch:
+    db.session.execute(table.insert(), batch)
+  for i in range(0, len(links), BATCH):
+    db.session.execute(genre_table.insert(), links[i:i + BATCH])
+
+
+def fill(venues, artists, shows):
+  from db import db
+  from models import Venue, Artist, Show, Genre, venue_genre, artist_genre
+  import counters
+  import areas
+  rand = Random(0)
+  now = datetime.now()
+  insert_batches(Genre.__table__, ({'id': i, 'name': name} for i, name in enumerate(GENRES, 1)))
+  insert_batches(Venue.__table__, venue_rows(rand, venues), venue_genre)
+  insert_batches(Artist.__table__, artist_rows(rand, artists), artist_genre)
+  insert_batches(Show.__table__, show_rows(rand, shows, venues, artists, now))
+  db.session.commit()
+  counters.refresh_upcoming_counts(now)
+  areas.refresh_areas()
+
+#----------------------------------------------------------------------------#
+# Scenarios.
+#----------------------------------------------------------------------------#
+
+def scenarios(rand, venues, artists, requests):
+  """name: list of (method, url, form data) to request"""
+  pick = lambda n: [rand.randint(1, n) for _ in range(requests)]
+  terms = [rand.choice(SEARCH_TERMS) for _ in range(requests)]
+  return {
+    '/venues': [('GET', '/venues', None)] * requests,
+    '/artists': [('GET', '/artists', None)] * requests,
+    '/shows': [('GET', '/shows', None)] * requests,
+    '/shows?when=upcoming&page=n': [
+      ('GET', f'/shows?when=upcoming&page={p}', None) for p in pick(50)],
+    '/venues/search': [('POST', '/venues/search', {'search_term': t}) for t in terms],
+    '/artists/search': [('POST', '/artists/search', {'search_term': t}) for t in terms],
+    '/venues/<id>': [('GET', f'/venues/{i}', None) for i in pick(venues)],
+    '/artists/<id>': [('GET', f'/artists/{i}', None) for i in pick(artists)],
+    '/venues?genre=g': [('GET', f'/venues?genre={quote(rand.choice(GENRES))}', None)
+                        for _ in range(requests)],
+    '/artists?genre=g': [('GET', f'/artists?genre={quote(rand.choice(GENRES))}', None)
+                         for _ in range(requests)],
+    '/venues/typeahead': [('GET', f'/venues/typeahead?q={quote(t[:3])}', None) for t in terms],
+    '/artists/typeahead': [('GET', f'/artists/typeahead?q={quote(t[:3])}', None) for t in terms],
+    '/venues?state=s&city=c&page=n': [
+      ('GET', f'/venues?state=NY&city=New%20York&page={p}', None) for p in pick(3)],
+  }
+
+
+def percentile(sorted_values, p):
+  """Nearest rank percentile."""
+  rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+  return sorted_values[rank - 1]
+
+
+def run(client, calls):
+  times, queries = [], []
+  for method, url, data in calls:
+    start = time.perf_counter()
+    response = client.open(url, method=method, data=data)
+    response.get_data()
+    times.append((time.perf_counter() - start) * 1000)
+    if response.status_code != 200:
+      raise RuntimeError(f'{method} {url} answered {response.status_code}')
+    queries.append(int(response.headers.get('X-Query-Count', 0)))
+  times.sort()
+  return {
+    'requests': len(calls),
+    'p50_ms': round(percentile(times, 50), 2),
+    'p95_ms': round(percentile(times, 95), 2),
+    'p99_ms': round(percentile(times, 99), 2),
+    'queries': round(sum(queries) / len(queries), 2),
+    'max_queries': max(queries),
+  }
+
+#----------------------------------------------------------------------------#
+# Baselines.
+#----------------------------------------------------------------------------#
+
+def compare(baseline, results, tolerance):
+  """Lines describing every scenario that got slower or runs more queries."""
+  regressions = []
+  for name, now in results.items():
+    before = baseline.get(name)
+    if before is None:
+      continue
+    if now['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+      regressions.append(f'{name}: p95 {before["p95_ms"]} -> {now["p95_ms"]} ms')
+    if now['max_queries'] > before['max_queries']:
+      regressions.append(f'{name}: queries {before["max_queries"]} -> {now["max_queries"]}')
+  return regressions
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Load test the Fyyur pages.')
+  parser.add_argument('--venues', type=int, default=1000)
+  parser.add_argument('--artists', type=int, default=10000)
+  parser.add_argument('--shows', type=int, default=100000)
+  parser.add_argument('--requests', type=int, default=50, help='per scenario')
+  parser.add_argument('--only', help='run the scenarios whose name contains this')
+  parser.add_argument('--db', help='database url, a temporary sqlite file by default')
+  parser.add_argument('--reuse', action='store_true', help="don't fill an already filled database")
+  parser.add_argument('--cache', action='store_true', help='leave the page cache on')
+  parser.add_argument('--save', action='store_true', help='store the results as the baseline')
+  parser.add_argument('--compare', action='store_true', help='compare with the baseline')
+  parser.add_argument('--baseline', default=BASELINE)
+  parser.add_argument('--tolerance', type=float, default=0.2,
+                      help='how much slower p95 may get before failing --compare')
+  args = parser.parse_args(argv)
+
+  url = args.db or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'loadtest.db')
+  from app import create_app
+  from db import db
+  from models import Venue
+  import pagecache
+  app = create_app(
+    migrate=False,
+    SQLALCHEMY_DATABASE_URI=url,
+    TESTING=True,
+    INSTRUMENT_LOG=False,
+    QUERY_LOG='off',
+  )
+  pagecache.page_cache.enabled = args.cache
+  scale = {'venues': args.venues, 'artists': args.artists, 'shows': args.shows}
+
+  with app.app_context():
+    db.create_all()
+    if not (args.reuse and Venue.query.first()):
+      start = time.perf_counter()
+      fill(**scale)
+      print(f'filled {scale} in {time.perf_counter() - start:.1f} s')
+
+  client = app.test_client()
+  results = {}
+  print(f'{"":30}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}')
+  all_calls = scenarios(Random(1), args.venues, args.artists, args.requests)
+  for name, calls in all_calls.items():
+    if args.only and args.only not in name:
+      continue
+    result = results[name] = run(client, calls)
+    print(f'{name:30}{result["p50_ms"]:9.1f}{result["p95_ms"]:9.1f}'
+          f'{result["p99_ms"]:9.1f}{result["queries"]:9.1f}')
+
+  if args.compare:
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    if baseline['scale'] != scale:
+      print(f'baseline is for {baseline["scale"]}, not comparing')
+      return 1
+    regressions = compare(baseline['results'], results, args.tolerance)
+    for line in regressions:
+      print('REGRESSION', line)
+    if regressions:
+      return 1
+    print('no regressions')
+  if args.save:
+    with open(args.baseline, 'w') as f:
+      json.dump({'scale': scale, 'results': results}, f, indent=2, sort_keys=True)
+    print(f'saved {args.baseline}')
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,39 @@
+"""upcoming show counters
+
+Revision ID: 5d1c3e9a7b20
+Revises: 2875fab414c8
+Create Date: 2026-10-18 10:12:41.508333
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d1c3e9a7b20'
+down_revision = '2875fab414c8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('artist', sa.Column('num_upcoming_shows', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('venue', sa.Column('num_upcoming_shows', sa.Integer(), server_default='0', nullable=False))
+
+    # count the shows already there, same as counters.refresh_upcoming_counts
+    now = datetime.now()
+    show = sa.table('show',
+        sa.column('id'), sa.column('venue_id'), sa.column('artist_id'), sa.column('start_time'))
+    for name in ('artist', 'venue'):
+        table = sa.table(name, sa.column('id'), sa.column('num_upcoming_shows'))
+        count = sa.select([sa.func.count(show.c.id)]).\
+                   where(sa.and_(show.c[f'{name}_id'] == table.c.id, show.c.start_time > now)).\
+                   as_scalar()
+        op.execute(table.update().values(num_upcoming_shows=count))
+
+
+def downgrade():
+    op.drop_column('venue', 'num_upcoming_shows')
+    op.drop_column('artist', 'num_upcoming_shows')
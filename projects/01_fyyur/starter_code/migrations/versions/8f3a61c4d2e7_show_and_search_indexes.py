@@ -0,0 +1,38 @@
+"""show and search indexes
+
+Revision ID: 8f3a61c4d2e7
+Revises: 5d1c3e9a7b20
+Create Date: 2026-10-18 15:40:09.214776
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f3a61c4d2e7'
+down_revision = '5d1c3e9a7b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_show_venue_id_start_time', 'show', ['venue_id', 'start_time'])
+    op.create_index('ix_show_artist_id_start_time', 'show', ['artist_id', 'start_time'])
+    op.create_index('ix_show_start_time_id', 'show', ['start_time', 'id'])
+    op.create_index('ix_venue_state_city', 'venue', ['state', 'city'])
+    # trigram indexes for the ilike name searches, plain ones elsewhere
+    for table in ('venue', 'artist'):
+        op.create_index(f'ix_{table}_name_trgm', table, ['name'],
+                        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_artist_name_trgm', table_name='artist')
+    op.drop_index('ix_venue_name_trgm', table_name='venue')
+    op.drop_index('ix_venue_state_city', table_name='venue')
+    op.drop_index('ix_show_start_time_id', table_name='show')
+    op.drop_index('ix_show_artist_id_start_time', table_name='show')
+    op.drop_index('ix_show_venue_id_start_time', table_name='show')
@@ -0,0 +1,85 @@
+"""genre tables
+
+Revision ID: b6d40e8f1c52
+Revises: 8f3a61c4d2e7
+Create Date: 2026-10-18 17:05:33.870412
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d40e8f1c52'
+down_revision = '8f3a61c4d2e7'
+branch_labels = None
+depends_on = None
+
+OWNERS = ('venue', 'artist')
+BATCH = 10000
+
+
+def _insert(table, rows):
+    for i in range(0, len(rows), BATCH):
+        op.get_bind().execute(table.insert(), rows[i:i + BATCH])
+
+
+def upgrade():
+    genre = op.create_table('genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    for owner in OWNERS:
+        op.create_table(f'{owner}_genre',
+        sa.Column(f'{owner}_id', sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint([f'{owner}_id'], [f'{owner}.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['genre_id'], ['genre.id'], ),
+        sa.PrimaryKeyConstraint(f'{owner}_id', 'genre_id')
+        )
+        op.create_index(f'ix_{owner}_genre_genre_id', f'{owner}_genre', ['genre_id', f'{owner}_id'])
+
+    # split the comma joined strings into rows
+    connection = op.get_bind()
+    owned = {}
+    for owner in OWNERS:
+        table = sa.table(owner, sa.column('id'), sa.column('genres'))
+        owned[owner] = [
+            (id_, list(dict.fromkeys(name.strip() for name in genres.split(',') if name.strip())))
+            for id_, genres in connection.execute(sa.select([table.c.id, table.c.genres]))
+        ]
+    names = sorted({name for rows in owned.values() for _, names in rows for name in names})
+    _insert(genre, [{'name': name} for name in names])
+    genre_ids = dict(connection.execute(sa.select([genre.c.name, genre.c.id])).fetchall())
+    for owner in OWNERS:
+        link = sa.table(f'{owner}_genre', sa.column(f'{owner}_id'), sa.column('genre_id'))
+        _insert(link, [
+            {f'{owner}_id': id_, 'genre_id': genre_ids[name]}
+            for id_, names in owned[owner] for name in names
+        ])
+        op.drop_column(owner, 'genres')
+
+
+def downgrade():
+    connection = op.get_bind()
+    genre = sa.table('genre', sa.column('id'), sa.column('name'))
+    for owner in OWNERS:
+        op.add_column(owner, sa.Column('genres', sa.String(length=120), server_default='', nullable=False))
+        link = sa.table(f'{owner}_genre', sa.column(f'{owner}_id'), sa.column('genre_id'))
+        joined = {}
+        query = sa.select([link.c[f'{owner}_id'], genre.c.name]).\
+                   select_from(link.join(genre, genre.c.id == link.c.genre_id)).\
+                   order_by(link.c[f'{owner}_id'], genre.c.name)
+        for id_, name in connection.execute(query):
+            joined.setdefault(id_, []).append(name)
+        table = sa.table(owner, sa.column('id'), sa.column('genres'))
+        update = table.update().where(table.c.id == sa.bindparam('id_')).\
+                                values(genres=sa.bindparam('joined'))
+        rows = [{'id_': id_, 'joined': ','.join(names)} for id_, names in joined.items()]
+        for i in range(0, len(rows), BATCH):
+            connection.execute(update, rows[i:i + BATCH])
+        op.drop_index(f'ix_{owner}_genre_genre_id', table_name=f'{owner}_genre')
+        op.drop_table(f'{owner}_genre')
+    op.drop_table('genre')
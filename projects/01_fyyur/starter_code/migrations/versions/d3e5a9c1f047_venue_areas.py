@@ -0,0 +1,45 @@
+"""venue areas
+
+Revision ID: d3e5a9c1f047
+Revises: b6d40e8f1c52
+Create Date: 2026-10-18 19:21:47.602195
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3e5a9c1f047'
+down_revision = 'b6d40e8f1c52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    area = op.create_table('area',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('num_venues', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('state', 'city')
+    )
+
+    # count the venues already there, same as areas.refresh_areas
+    venue = sa.table('venue', sa.column('id'), sa.column('state'), sa.column('city'))
+    op.execute(area.insert().from_select(
+        ['state', 'city', 'num_venues'],
+        sa.select([venue.c.state, venue.c.city, sa.func.count(venue.c.id)]).
+           group_by(venue.c.state, venue.c.city)
+    ))
+
+    # an area's venues are listed by name
+    op.drop_index('ix_venue_state_city', table_name='venue')
+    op.create_index('ix_venue_state_city_name', 'venue', ['state', 'city', 'name'])
+
+
+def downgrade():
+    op.drop_index('ix_venue_state_city_name', table_name='venue')
+    op.create_index('ix_venue_state_city', 'venue', ['state', 'city'])
+    op.drop_table('area')
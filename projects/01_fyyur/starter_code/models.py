@@ -1,10 +1,53 @@
+from sqlalchemy import DDL, event
+
 from db import db
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+def genre_table(owner):
+    """The association table between genre and owner ('venue' or 'artist')."""
+    key = f'{owner}_id'
+    return db.Table(f'{owner}_genre',
+        db.Column(key, db.Integer, db.ForeignKey(f'{owner}.id', ondelete='CASCADE'), primary_key=True),
+        db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'), primary_key=True),
+        #the primary key finds an owner's genres, this a genre's owners
+        db.Index(f'ix_{owner}_genre_genre_id', 'genre_id', key),
+    )
+
+
+venue_genre = genre_table('venue')
+artist_genre = genre_table('artist')
+
+
+class Genre(db.Model):
+    __tablename__ = 'genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False, unique=True)
+
+    @classmethod
+    def named(cls, names):
+        """The genres called names, adding the ones there aren't rows for yet."""
+        names = list(dict.fromkeys(name.strip() for name in names if name.strip()))
+        if not names:
+            return []
+        found = {genre.name: genre for genre in cls.query.filter(cls.name.in_(names))}
+        return [found.get(name) or cls(name=name) for name in names]
+
+    def __repr__(self):
+        return f'<Genre :: {self.id} : {self.name}>'
+
+
 class Venue(db.Model):
     __tablename__ = 'venue'
+    __table_args__ = (
+        #the venue listing pages through an area by name
+        db.Index('ix_venue_state_city_name', 'state', 'city', 'name'),
+        #search is ilike '%term%', which only a trigram index can serve
+        db.Index('ix_venue_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
@@ -21,8 +64,10 @@ class Venue(db.Model):
     #without a venue there is no show, thus 'delete-orphan'
     shows = db.relationship('Show', backref='venue', lazy=True, cascade='all, delete-orphan')
 
-    #comma joined string
-    genres = db.Column(db.String(120), nullable=False, default='')
+    genres = db.relationship('Genre', secondary=venue_genre, order_by=Genre.name)
+
+    #kept by counters.py so listings don't have to aggregate shows
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def __repr__(self):
         return f'<Venue :: {self.id} : {self.name} : {self.city}>'
@@ -30,6 +75,10 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'artist'
+    __table_args__ = (
+        db.Index('ix_artist_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
@@ -45,15 +94,42 @@ class Artist(db.Model):
     #without an artist there is no show, thus 'delete-orphan'
     shows = db.relationship('Show', backref='artist', lazy=True, cascade='all, delete-orphan')
 
-    #comma joined string
-    genres = db.Column(db.String(120), nullable=False, default='')
+    genres = db.relationship('Genre', secondary=artist_genre, order_by=Genre.name)
+
+    #kept by counters.py so listings don't have to aggregate shows
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def __repr__(self):
         return f'<Artist :: {self.id} : {self.name} : {self.city}>'
 
 
+class Area(db.Model):
+    __tablename__ = 'area'
+    __table_args__ = (
+        db.UniqueConstraint('state', 'city'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+
+    #kept by areas.py so the venue listing can page through areas
+    #without grouping every venue
+    num_venues = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    def __repr__(self):
+        return f'<Area :: {self.id} : {self.city}, {self.state} : {self.num_venues} venues>'
+
+
 class Show(db.Model):
     __tablename__ = 'show'
+    __table_args__ = (
+        #a venue's or artist's shows in time order, and their upcoming counts
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        #the /shows listing, in (start_time, id) order
+        db.Index('ix_show_start_time_id', 'start_time', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), nullable=False)
@@ -62,3 +138,8 @@ class Show(db.Model):
 
     def __repr__(self):
         return f'<Show :: {self.id} : venue {self.venue_id} : artist {self.artist_id} : {self.start_time}>'
+
+
+#the trigram indexes need the pg_trgm extension
+event.listen(db.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
@@ -0,0 +1,207 @@
+#Caches rendered GET pages in process.
+#
+#A view opts in with the cached_page decorator, naming tags for the rows
+#the page shows, e.g. 'venue:{venue_id}' filled from the view's
+#arguments, and can add more while it runs with tag_page (a venue page
+#tags the artists playing there). Whole listings use the names 'venues',
+#'artists' and 'shows'.
+#
+#SQLAlchemy events on Venue, Artist and Show collect the tags a change
+#affects, and they are dropped from the cache when the session commits,
+#so a new show only clears its venue's page, its artist's page and the
+#listings that count or list shows. Entries also expire after a while
+#for changes made outside this process (flask refresh-upcoming).
+
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import g, request, session, jsonify, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.attributes import get_history
+
+from models import Venue, Artist, Show
+
+
+class PageCache:
+  """
+  LRU cache of rendered pages, capped by entry count and total body size.
+  """
+  def __init__(self, max_entries=512, max_bytes=32 * 2**20, ttl=300, clock=time.monotonic):
+    self.enabled = True
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.ttl = ttl
+    self.clock = clock
+    self._lock = threading.Lock()
+    #key: (expires, body, mimetype, tags), least recently used first
+    self._entries = OrderedDict()
+    #tag: keys of the entries carrying it
+    self._keys = {}
+    self._bytes = 0
+    #bumped by every invalidation, so a page rendered from data that
+    #changed while it was rendering isn't stored
+    self.generation = 0
+    self.hits = self.misses = self.evictions = self.invalidations = 0
+
+  def configure(self, config):
+    self.enabled = config.get('PAGE_CACHE_ENABLED', self.enabled)
+    self.max_entries = config.get('PAGE_CACHE_MAX_ENTRIES', self.max_entries)
+    self.max_bytes = config.get('PAGE_CACHE_MAX_BYTES', self.max_bytes)
+    self.ttl = config.get('PAGE_CACHE_TTL', self.ttl)
+
+  def _drop(self, key):
+    _, body, _, tags = self._entries.pop(key)
+    self._bytes -= len(body)
+    for tag in tags:
+      keys = self._keys[tag]
+      keys.discard(key)
+      if not keys:
+        del self._keys[tag]
+
+  def get(self, key):
+    """Return (body, mimetype) or None."""
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None and entry[0] <= self.clock():
+        self._drop(key)
+        entry = None
+      if entry is None:
+        self.misses += 1
+        return None
+      self.hits += 1
+      self._entries.move_to_end(key)
+      return entry[1], entry[2]
+
+  def set(self, key, body, mimetype, tags, generation):
+    if len(body) > self.max_bytes:
+      return
+    with self._lock:
+      if generation != self.generation:
+        return
+      if key in self._entries:
+        self._drop(key)
+      self._entries[key] = (self.clock() + self.ttl, body, mimetype, frozenset(tags))
+      self._bytes += len(body)
+      for tag in tags:
+        self._keys.setdefault(tag, set()).add(key)
+      while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+        self._drop(next(iter(self._entries)))
+        self.evictions += 1
+
+  def invalidate(self, tags):
+    with self._lock:
+      self.generation += 1
+      for tag in tags:
+        for key in list(self._keys.get(tag, ())):
+          self._drop(key)
+          self.invalidations += 1
+
+  def clear(self):
+    with self._lock:
+      for key in list(self._entries):
+        self._drop(key)
+
+  def stats(self):
+    with self._lock:
+      return {
+        'entries': len(self._entries),
+        'bytes': self._bytes,
+        'hits': self.hits,
+        'misses': self.misses,
+        'evictions': self.evictions,
+        'invalidations': self.invalidations,
+      }
+
+
+page_cache = PageCache()
+
+#----------------------------------------------------------------------------#
+# Views.
+#----------------------------------------------------------------------------#
+
+def tag_page(*tags):
+  """Add tags to the page the current view is rendering."""
+  g.page_tags.update(tags)
+
+
+def cached_page(*tags):
+  """
+  Serve the view from page_cache, keyed by path and query string.
+  tags are formatted with the view's keyword arguments.
+  Pages aren't cached or served from cache while there are flashed
+  messages waiting, since those are shown once on whatever comes next.
+  """
+  def decorator(view_func):
+    @wraps(view_func)
+    def wrapper(**kwargs):
+      #set even when not caching, the view may call tag_page either way
+      g.page_tags = {tag.format(**kwargs) for tag in tags}
+      if not page_cache.enabled or '_flashes' in session:
+        return view_func(**kwargs)
+      key = request.full_path
+      cached = page_cache.get(key)
+      if cached is not None:
+        body, mimetype = cached
+        return Response(body, mimetype=mimetype)
+      generation = page_cache.generation
+      response = view_func(**kwargs)
+      if not isinstance(response, Response):
+        response = Response(response)
+      if response.status_code == 200 and not response.is_streamed:
+        page_cache.set(key, response.get_data(), response.mimetype, g.page_tags, generation)
+      return response
+    return wrapper
+  return decorator
+
+
+def init_app(app):
+  page_cache.configure(app.config)
+
+  @app.route('/cache-stats')
+  def cache_stats():
+    return jsonify(page_cache.stats())
+
+#----------------------------------------------------------------------------#
+# Invalidation.
+#----------------------------------------------------------------------------#
+
+def _values(target, attr):
+  """The current and, if it's being changed, previous value of attr."""
+  history = get_history(target, attr)
+  return {getattr(target, attr), *history.deleted}
+
+
+def _tags_for(target):
+  if isinstance(target, Show):
+    tags = {'shows', 'venues'}
+    tags.update(f'venue:{id_}' for id_ in _values(target, 'venue_id'))
+    tags.update(f'artist:{id_}' for id_ in _values(target, 'artist_id'))
+    return tags
+  name = target.__tablename__
+  return {f'{name}:{target.id}', f'{name}s', 'shows'}
+
+
+def _collect(mapper, connection, target):
+  session = object_session(target)
+  if session is not None:
+    session.info.setdefault('page_tags', set()).update(_tags_for(target))
+
+
+for model in (Venue, Artist, Show):
+  for name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(model, name, _collect)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate(session):
+  tags = session.info.pop('page_tags', None)
+  if tags:
+    page_cache.invalidate(tags)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget(session, previous_transaction):
+  session.info.pop('page_tags', None)
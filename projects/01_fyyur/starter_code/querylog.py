@@ -0,0 +1,117 @@
+#Watches the SQL the app runs for two kinds of trouble:
+#  * slow statements, anything taking longer than QUERY_LOG_SLOW_MS, which
+#    are logged with their SQL, parameters, view and the line that ran them
+#  * the N+1 pattern, one request running the same statement, differing
+#    only in its parameters, more than QUERY_LOG_REPEAT_LIMIT times, as
+#    when a template loops over rows touching a lazy relationship
+#
+#QUERY_LOG is 'log' to log both as warnings, 'raise' to also fail the
+#request on an N+1 so it can't go unnoticed while developing, or 'off'.
+#
+#Code that repeats a statement on purpose, like a loop reading rows in
+#chunks, runs it inside `with querylog.batched():` so the repeats aren't
+#counted.  Slow statements are still logged there.
+
+import os
+import re
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, current_app, has_app_context, has_request_context, request
+
+import db as db_module
+
+
+class RepeatedQueryError(RuntimeError):
+  pass
+
+
+_placeholders = re.compile(r'\(\s*(?:\?|%\(\w+\)s|%s)(?:\s*,\s*(?:\?|%\(\w+\)s|%s))*\s*\)')
+_space = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+  """
+  The statement with whitespace and lists of placeholders collapsed,
+  so IN (?, ?) and IN (?, ?, ?) count as the same statement.
+  """
+  return _placeholders.sub('(?)', _space.sub(' ', statement).strip())
+
+
+def _caller():
+  """file:line and function of the innermost app code running a statement"""
+  root = current_app.root_path
+  listeners = (os.path.abspath(__file__), os.path.abspath(db_module.__file__))
+  for frame in reversed(traceback.extract_stack()):
+    path = os.path.abspath(frame.filename)
+    if path.startswith(root) and path not in listeners and 'site-packages' not in path:
+      return f'{os.path.relpath(path, root)}:{frame.lineno} in {frame.name}'
+  return 'unknown'
+
+
+def _view():
+  return request.endpoint if has_request_context() else '<no request>'
+
+
+def _truncate(value, length=500):
+  text = repr(value)
+  return text if len(text) <= length else text[:length] + '...'
+
+#----------------------------------------------------------------------------#
+# Statement events.
+#----------------------------------------------------------------------------#
+
+#db.py times the statements and passes each one on
+def _check(statement, parameters, seconds):
+  if not has_app_context():
+    return
+  config = current_app.config
+  if config.get('QUERY_LOG', 'off') == 'off':
+    return
+  ms = seconds * 1000
+
+  slow_ms = config.get('QUERY_LOG_SLOW_MS')
+  if slow_ms is not None and ms > slow_ms:
+    current_app.logger.warning(
+      'slow query %.1f ms in %s at %s\n%s\nparameters: %s',
+      ms, _view(), _caller(), statement, _truncate(parameters))
+
+  limit = config.get('QUERY_LOG_REPEAT_LIMIT')
+  if limit is None or not has_request_context() or g.get('query_batches'):
+    return
+  shapes = g.get('query_shapes')
+  if shapes is None:
+    shapes = g.query_shapes = Counter()
+  shape = statement_shape(statement)
+  shapes[shape] += 1
+  #report each statement once, when it first goes over the limit
+  if shapes[shape] == limit + 1:
+    message = (f'possible N+1 in {_view()}: the same statement ran more than '
+               f'{limit} times, latest at {_caller()}\n{shape}')
+    current_app.logger.warning(message)
+    if config['QUERY_LOG'] == 'raise':
+      raise RepeatedQueryError(message)
+
+
+db_module.statement_listeners.append(_check)
+
+
+@contextmanager
+def batched():
+  """Don't count repeated statements inside the with block."""
+  if not has_request_context():
+    yield
+    return
+  g.query_batches = g.get('query_batches', 0) + 1
+  try:
+    yield
+  finally:
+    g.query_batches -= 1
+
+
+def init_app(app):
+  """Start counting statements afresh for each request."""
+  @app.before_request
+  def reset_query_shapes():
+    g.query_shapes = Counter()
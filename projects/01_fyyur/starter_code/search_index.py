@@ -0,0 +1,199 @@
+#In-memory name index for venue and artist search.
+#
+#Each name is folded (lowercased and stripped of accents unless
+#SEARCH_FOLD_CASE or SEARCH_FOLD_DIACRITICS say otherwise) and stored once
+#for every word it has, from that word to the end, in one sorted list:
+#'The Blue Note' as 'the blue note', 'blue note' and 'note'.  A search is
+#then a bisect for the folded term and a walk along the keys it prefixes,
+#so 'blu' and 'blue n' both find it and no query is run.
+#
+#The index is read from the database on first use.  SQLAlchemy events on
+#Venue and Artist collect the names a session changes, applied when it
+#commits.  Changes made by other processes, or without the ORM
+#(bulkload.py), show up when the index is read again, after
+#SEARCH_INDEX_TTL seconds.
+
+import heapq
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import Venue, Artist
+from db import db
+
+
+def fold(text, case=True, diacritics=True):
+  """text with runs of whitespace made single spaces, folded as asked."""
+  #most names are plain ascii, which has nothing to strip
+  if diacritics and not text.isascii():
+    text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+  if case:
+    text = text.casefold()
+  return ' '.join(text.split())
+
+
+class NameIndex:
+  """Sorted word-suffix keys of the names of one model's rows."""
+  def __init__(self, model, fold_case=True, fold_diacritics=True, ttl=300, clock=time.monotonic):
+    self.model = model
+    self.fold_case = fold_case
+    self.fold_diacritics = fold_diacritics
+    self.ttl = ttl
+    self.clock = clock
+    self._lock = threading.Lock()
+    self._load_lock = threading.Lock()
+    #(key, id) in order, and id: (name, keys)
+    self._keys = []
+    self._names = {}
+    self._expires = None
+    #changes committed while the index is being read, replayed after
+    self._pending = None
+
+  def _fold(self, text):
+    return fold(text, self.fold_case, self.fold_diacritics)
+
+  def _suffixes(self, name):
+    words = self._fold(name).split(' ')
+    return {' '.join(words[i:]) for i in range(len(words)) if words[i]}
+
+  def _add(self, id_, name):
+    keys = self._suffixes(name)
+    self._names[id_] = (name, keys)
+    for key in keys:
+      insort(self._keys, (key, id_))
+
+  def _remove(self, id_):
+    entry = self._names.pop(id_, None)
+    if entry is None:
+      return
+    for key in entry[1]:
+      i = bisect_left(self._keys, (key, id_))
+      del self._keys[i]
+
+  def _apply(self, id_, name):
+    self._remove(id_)
+    if name is not None:
+      self._add(id_, name)
+
+  def load(self):
+    """Read every name from the database."""
+    with self._lock:
+      self._pending = []
+    try:
+      rows = db.session.query(self.model.id, self.model.name).all()
+    except Exception:
+      with self._lock:
+        self._pending = None
+      raise
+    keys, names = [], {}
+    for id_, name in rows:
+      suffixes = self._suffixes(name)
+      names[id_] = (name, suffixes)
+      keys.extend((key, id_) for key in suffixes)
+    keys.sort()
+    with self._lock:
+      self._keys, self._names = keys, names
+      for change in self._pending:
+        self._apply(*change)
+      self._pending = None
+      self._expires = self.clock() + self.ttl
+
+  def reset(self):
+    """Forget everything, the next search reads the names again."""
+    with self._lock:
+      self._keys, self._names, self._expires = [], {}, None
+
+  def changed(self, id_, name):
+    """Row id_ is now called name, or is gone if name is None."""
+    with self._lock:
+      if self._pending is not None:
+        self._pending.append((id_, name))
+      if self._expires is not None:
+        self._apply(id_, name)
+
+  def _stale(self):
+    return self._expires is None or self._expires <= self.clock()
+
+  def search(self, term, limit=None):
+    """
+    (id, name) of the rows with a word starting with term, by name, only
+    the first limit of them if given.
+    """
+    if self._stale():
+      with self._load_lock:
+        if self._stale():
+          self.load()
+    term = self._fold(term)
+    if not term:
+      return []
+    found = {}
+    with self._lock:
+      i = bisect_left(self._keys, (term,))
+      #the keys are in order of the matched word, not the name, so every
+      #match is collected before picking the first by name
+      while i < len(self._keys):
+        key, id_ = self._keys[i]
+        if not key.startswith(term):
+          break
+        if id_ not in found:
+          found[id_] = self._names[id_][0]
+        i += 1
+    by_name = lambda item: (item[1].casefold(), item[0])
+    if limit is not None:
+      return heapq.nsmallest(limit, found.items(), key=by_name)
+    return sorted(found.items(), key=by_name)
+
+  def __len__(self):
+    return len(self._names)
+
+
+indexes = {Venue: NameIndex(Venue), Artist: NameIndex(Artist)}
+
+
+def search(model, term, limit=None):
+  return indexes[model].search(term, limit)
+
+
+def init_app(app):
+  for index in indexes.values():
+    index.fold_case = app.config.get('SEARCH_FOLD_CASE', index.fold_case)
+    index.fold_diacritics = app.config.get('SEARCH_FOLD_DIACRITICS', index.fold_diacritics)
+    index.ttl = app.config.get('SEARCH_INDEX_TTL', index.ttl)
+    index.reset()
+
+#----------------------------------------------------------------------------#
+# Keeping up.
+#----------------------------------------------------------------------------#
+
+def _collect(mapper, connection, target):
+  session = object_session(target)
+  if session is not None:
+    session.info.setdefault('search_changes', {})[(type(target), target.id)] = target.name
+
+
+def _collect_delete(mapper, connection, target):
+  session = object_session(target)
+  if session is not None:
+    session.info.setdefault('search_changes', {})[(type(target), target.id)] = None
+
+
+for model in indexes:
+  event.listen(model, 'after_insert', _collect)
+  event.listen(model, 'after_update', _collect)
+  event.listen(model, 'after_delete', _collect_delete)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+  changes = session.info.pop('search_changes', None)
+  for (model, id_), name in (changes or {}).items():
+    indexes[model].changed(id_, name)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget(session, previous_transaction):
+  session.info.pop('search_changes', None)
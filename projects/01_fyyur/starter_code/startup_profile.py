@@ -0,0 +1,79 @@
+#Shows where the time goes when Fyyur starts.
+#
+#Starts a fresh python a few times doing what a web worker does, import
+#app.py and call create_app(migrate=False), and reports the quickest
+#start, how much of it was create_app, and from one more start run under
+#`python -X importtime`, how long importing each package took, counting
+#only the time spent in its own modules.  --migrate includes the `flask
+#db` commands, as the flask command does, and --modules lists modules
+#rather than packages.
+#
+#usage:
+#  python startup_profile.py
+#  python startup_profile.py --migrate --modules --top 40
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+#prints how long create_app took, in the child python
+START = '''
+import time
+from app import create_app
+start = time.perf_counter()
+create_app(migrate={migrate})
+print(time.perf_counter() - start)
+'''
+
+
+def start(migrate, importtime=False):
+  """(seconds the whole start took, seconds in create_app, stderr)"""
+  command = [sys.executable]
+  if importtime:
+    command += ['-X', 'importtime']
+  command += ['-c', START.format(migrate=migrate)]
+  begin = time.perf_counter()
+  result = subprocess.run(command, cwd=HERE, capture_output=True, text=True, check=True)
+  return time.perf_counter() - begin, float(result.stdout.split()[-1]), result.stderr
+
+
+def import_times(stderr):
+  """[(module, microseconds in its own code)] from -X importtime output"""
+  times = []
+  for line in stderr.splitlines():
+    if not line.startswith('import time:') or 'self [us]' in line:
+      continue
+    own, cumulative, name = line[len('import time:'):].split('|')
+    times.append((name.strip(), int(own)))
+  return times
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Time the imports and setup of a Fyyur start.')
+  parser.add_argument('--migrate', action='store_true', help='set up the flask db commands too')
+  parser.add_argument('--modules', action='store_true', help='list modules, not packages')
+  parser.add_argument('--top', type=int, default=20, help='how many to list')
+  parser.add_argument('--runs', type=int, default=5, help='starts to take the quickest of')
+  args = parser.parse_args(argv)
+
+  runs = [start(args.migrate)[:2] for i in range(args.runs)]
+  total, create = min(runs)
+  print(f'start {total * 1000:.0f} ms, create_app {create * 1000:.0f} ms, '
+        f'quickest of {args.runs}')
+
+  spent = Counter()
+  for name, own in import_times(start(args.migrate, importtime=True)[2]):
+    spent[name if args.modules else name.split('.')[0]] += own
+  print(f'imports {sum(spent.values()) / 1000:.0f} ms (slower under -X importtime)')
+  for name, own in spent.most_common(args.top):
+    print(f'{own / 1000:8.1f} ms  {name}')
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,192 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import create_app
+from db import db
+from models import Venue, Artist, Show, Genre, Area
+import areas
+import bulkload
+import controllers
+import instrument
+import pagecache
+
+
+def write_file(test, name, text):
+  """Path of a file holding text, removed when test ends."""
+  directory = tempfile.TemporaryDirectory()
+  test.addCleanup(directory.cleanup)
+  path = os.path.join(directory.name, name)
+  with open(path, 'w', newline='', encoding='utf-8') as f:
+    f.write(text)
+  return path
+
+
+class FyyurTestCase(unittest.TestCase):
+  """Pages against an in-memory sqlite database."""
+
+  def setUp(self):
+    self.app = create_app(
+      migrate=False,
+      SQLALCHEMY_DATABASE_URI='sqlite://',
+      TESTING=True,
+      INSTRUMENT_LOG=False,
+    )
+    #every request should reach the database
+    pagecache.page_cache.enabled = False
+    self.client = self.app.test_client
+    with self.app.app_context():
+      db.create_all()
+      venue = Venue(name='The Musical Hop', city='San Francisco', state='CA',
+                    address='1015 Folsom Street', phone='123-123-1234',
+                    genres=Genre.named(['Jazz', 'Swing']))
+      artist = Artist(name='Guns N Petals', city='San Francisco', state='CA',
+                      phone='326-123-5000', genres=Genre.named(['Rock n Roll']))
+      now = datetime.now()
+      db.session.add_all([
+        Show(venue=venue, artist=artist, start_time=now + timedelta(days=days))
+        for days in (-30, -1, 1, 30)
+      ])
+      db.session.commit()
+      self.venue_id, self.artist_id = venue.id, artist.id
+
+  def tearDown(self):
+    with self.app.app_context():
+      db.session.remove()
+      db.drop_all()
+    pagecache.page_cache.enabled = True
+
+  def test_show_venue_queries(self):
+    result = self.client().get(f'/venues/{self.venue_id}')
+    self.assertEqual(result.status_code, 200)
+    self.assertIn(b'The Musical Hop', result.data)
+    self.assertLessEqual(int(result.headers['X-Query-Count']), 2)
+
+  def test_show_artist_queries(self):
+    result = self.client().get(f'/artists/{self.artist_id}')
+    self.assertEqual(result.status_code, 200)
+    self.assertIn(b'Guns N Petals', result.data)
+    self.assertLessEqual(int(result.headers['X-Query-Count']), 2)
+
+  def test_request_log_uses_query_counter(self):
+    self.app.config['INSTRUMENT_LOG'] = True
+    with self.assertLogs(f'{self.app.name}.requests') as logs:
+      result = self.client().get(f'/venues/{self.venue_id}')
+    line = json.loads(logs.records[-1].getMessage())
+    self.assertEqual(line['queries'], int(result.headers['X-Query-Count']))
+    #db.py counts the statements, instrument shouldn't count them again
+    self.assertFalse(event.contains(Engine, 'after_cursor_execute',
+                                    instrument._after_cursor_execute))
+
+  def test_batched_search_isnt_an_n_plus_1(self):
+    with self.app.app_context():
+      db.session.add_all([
+        Venue(name=f'The Musical Hop {i}', city='San Francisco', state='CA',
+              address='1015 Folsom Street', phone='123-123-1234')
+        for i in range(3)
+      ])
+      db.session.commit()
+    self.app.config.update(QUERY_LOG='raise', QUERY_LOG_REPEAT_LIMIT=2)
+    #a query per match
+    with mock.patch.object(controllers, 'SEARCH_IDS_PER_QUERY', 1):
+      result = self.client().post('/venues/search', data={'search_term': 'musical'})
+    self.assertEqual(result.status_code, 200)
+    self.assertIn(b'The Musical Hop 2', result.data)
+
+  def test_load_shows_with_offset(self):
+    path = write_file(self, 'shows.csv',
+                      'venue_id,artist_id,start_time\n'
+                      f'{self.venue_id},{self.artist_id},2030-01-01T12:00:00+02:00\n')
+    with self.app.app_context():
+      self.assertEqual(bulkload.load('shows', path), (1, 0))
+      times = [show.start_time for show in Show.query]
+    self.assertIn(datetime(2030, 1, 1, 10), times)
+
+  def test_load_rejects_long_strings(self):
+    path = write_file(self, 'artists.csv',
+                      'name,city,state,phone,image_link\n'
+                      f'The Wild Sax Band,San Francisco,CA,432-325-5432,{"x" * 501}\n'
+                      'Matt Quevedo,New York,NY,300-400-5000,\n')
+    with self.app.app_context():
+      rejects = io.StringIO()
+      self.assertEqual(bulkload.load('artists', path, rejects=rejects), (1, 1))
+      self.assertEqual(Artist.query.filter_by(name='The Wild Sax Band').count(), 0)
+    reject = json.loads(rejects.getvalue())
+    self.assertEqual(reject['line'], 1)
+    self.assertIn('image_link', reject['reason'])
+
+  def area_added_meanwhile(self):
+    """_add after another transaction has added the area, returns its venues"""
+    real_update = areas._update
+    misses = [True]
+    def update(*args):
+      #the first update runs before the other transaction's insert
+      return 0 if misses and misses.pop() else real_update(*args)
+    with self.app.app_context():
+      with mock.patch.object(areas, '_update', update):
+        areas._add(db.session.connection(), 'CA', 'San Francisco', 1)
+      db.session.commit()
+      return Area.query.filter_by(state='CA', city='San Francisco').one().num_venues
+
+  def test_area_added_meanwhile(self):
+    self.assertEqual(self.area_added_meanwhile(), 2)
+
+  def test_area_added_meanwhile_without_upsert(self):
+    with mock.patch.dict(areas.UPSERTS, clear=True):
+      self.assertEqual(self.area_added_meanwhile(), 2)
+
+  def test_typeahead_limit_takes_first_names(self):
+    with self.app.app_context():
+      #'aardvark' comes before 'alpha', 'Alpha' before 'Zulu Aardvark'
+      db.session.add_all([
+        Venue(name=name, city='San Francisco', state='CA',
+              address='1015 Folsom Street', phone='123-123-1234')
+        for name in ('Zulu Aardvark', 'Alpha')
+      ])
+      db.session.commit()
+    result = self.client().get('/venues/typeahead?q=a&limit=1')
+    self.assertEqual([venue['name'] for venue in result.json['data']], ['Alpha'])
+
+
+@unittest.skipUnless(os.environ.get('FYYUR_TEST_DATABASE_URL'),
+                     'set FYYUR_TEST_DATABASE_URL to an empty postgres database')
+class PostgresLoadTestCase(unittest.TestCase):
+  """Bulk loading with COPY, against a real postgres database."""
+
+  def setUp(self):
+    self.app = create_app(
+      migrate=False,
+      SQLALCHEMY_DATABASE_URI=os.environ['FYYUR_TEST_DATABASE_URL'],
+      TESTING=True,
+      INSTRUMENT_LOG=False,
+    )
+    with self.app.app_context():
+      db.create_all()
+
+  def tearDown(self):
+    with self.app.app_context():
+      db.session.remove()
+      db.drop_all()
+
+  def test_copy_empty_optional_fields(self):
+    path = write_file(self, 'venues.csv',
+                      'name,city,state,address,phone,image_link,facebook_link,'
+                      'website,seeking_description,genres\n'
+                      'The Dueling Pianos Bar,New York,NY,335 Delancey Street,'
+                      '914-003-1132,,,,,\n')
+    with self.app.app_context():
+      self.assertEqual(bulkload.load('venues', path), (1, 0))
+      venue = Venue.query.one()
+      self.assertEqual((venue.image_link, venue.facebook_link, venue.website,
+                        venue.seeking_description), ('', '', '', ''))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -1,4 +1,7 @@
-from app import Venue, Artist, Show, db, format_datetime
+from app import create_app
+from models import Venue, Artist, Show, Genre
+from db import db
+from formatting import format_datetime
 from sqlalchemy import func
 from sqlalchemy import distinct
 from datetime import datetime
@@ -85,7 +88,7 @@ def show_venue():
     "past_shows_count": 1,
     "upcoming_shows_count": 1,
   }]:
-    d['genres'] = ','.join(d['genres'])
+    d['genres'] = Genre.named(d['genres'])
     d.pop("upcoming_shows")
     d.pop("past_shows")
     d.pop("past_shows_count")
@@ -170,7 +173,7 @@ def show_artist():
     "past_shows_count": 0,
     "upcoming_shows_count": 3,
   }]:
-    d['genres'] = ','.join(d['genres'])
+    d['genres'] = Genre.named(d['genres'])
     d.pop("upcoming_shows")
     d.pop("past_shows")
     d.pop("past_shows_count")
@@ -294,7 +297,8 @@ def look_some_things_up():
         print(r.artist_id, r.start_time, r.artist_name, r.artist_image_link[:12])
 
 def main():
-    look_some_things_up()
+    with create_app(migrate=False).app_context():
+        look_some_things_up()
     return 0
 
 if __name__ == '__main__':
@@ -0,0 +1,81 @@
+'''
+Benchmark for picking a quiz question.
+
+Compares the old COUNT + OFFSET query against the in memory id index
+in flaskr.quiz over a range of question pool sizes and
+previous_questions lengths.  Runs against a throwaway sqlite database
+so the numbers are relative, not what postgres would give.
+
+usage: python bench_quiz.py
+'''
+import os
+import sys
+import tempfile
+import timeit
+from random import randrange, sample
+
+from flask import Flask
+
+from models import setup_db, db, Question
+from flaskr.quiz import question_index
+
+POOL_SIZES = [100, 1000, 10000, 100000]
+PREVIOUS_LENGTHS = [0, 10, 100, 1000]
+CATEGORIES = 6
+REPEAT = 50
+
+
+def old_select(prevs, cat_id):
+  filters = [Question.id.notin_(prevs)]
+  if cat_id:
+    filters.append(Question.category == cat_id)
+  query = Question.query.filter(*filters)
+  count = query.count()
+  if count:
+    return query.offset(randrange(0, count)).first()
+
+
+def new_select(prevs, cat_id):
+  id_ = question_index.sample(cat_id, prevs)
+  if id_ is not None:
+    return Question.query.get(id_)
+
+
+def fill(n):
+  db.session.query(Question).delete()
+  db.session.bulk_insert_mappings(Question, [{
+    'id': i,
+    'question': f'question {i}',
+    'answer': f'answer {i}',
+    'category': i % CATEGORIES + 1,
+    'difficulty': i % 5 + 1
+  } for i in range(1, n + 1)])
+  db.session.commit()
+  question_index.load()
+
+
+def ms(f, *args):
+  return min(timeit.repeat(lambda: f(*args), number=1, repeat=REPEAT)) * 1000
+
+
+def main(database_path):
+  app = Flask(__name__)
+  setup_db(app, database_path)
+  with app.app_context():
+    db.create_all()
+    print(f'{"questions":>10} {"previous":>9} {"old ms":>9} {"index ms":>9}')
+    for n in POOL_SIZES:
+      fill(n)
+      for k in PREVIOUS_LENGTHS:
+        if k >= n:
+          continue
+        prevs = sample(range(1, n + 1), k)
+        old = ms(old_select, prevs, 1)
+        new = ms(new_select, prevs, 1)
+        print(f'{n:>10} {k:>9} {old:>9.3f} {new:>9.3f}')
+  return 0
+
+
+if __name__ == '__main__':
+  path = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+  sys.exit(main(path))
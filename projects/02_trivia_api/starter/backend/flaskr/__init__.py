@@ -3,24 +3,43 @@ import sys
 from flask import Flask, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from random import randrange
 
-from models import setup_db, Question, Category, rollback
+from models import setup_db, Question, rollback
+from .pagination import fetch_page, decode_cursor, question_count
+from .quiz import question_index
+from .sessions import MemorySessionStore, start_session, next_question_id
+from .search import search_backend
+from .categories import category_cache
+from .instrument import Instrumentation
 
 QUESTIONS_PER_PAGE = 10
 
 
-def select_random(query, randomrange=randrange):
-  r = randomrange(0, query.count())
-  return query.offset(r).first()
+def quiz_category(json):
+  '''
+  The category id asked for in a quiz request, None meaning all
+  of them, which the frontend sends as 0.  Aborts with a 400 if
+  it isn't a number.
+  '''
+  cat_id = (json or {}).get('quiz_category')
+  try:
+    return int(cat_id) if cat_id else None
+  except (TypeError, ValueError):
+    abort(400)
 
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
+  if test_config:
+    app.config.update(test_config)
   setup_db(app)
+  quiz_sessions = app.config.get('QUIZ_SESSION_STORE') or MemorySessionStore()
+  question_search = search_backend(app.config.get('SEARCH_BACKEND', 'memory'))
+  categories_max_age = app.config.get('CATEGORIES_MAX_AGE', 300)
 
   CORS(app)
+  Instrumentation(app)
   @app.after_request
   def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
@@ -30,33 +49,45 @@ def create_app(test_config=None):
 
   @app.route('/categories', methods=['GET'])
   def get_categories():
-    q = Category.query
-    count = q.count()
-    cats = {c.id: c.type for c in q}
-    if count == 0:
+    cats, version = category_cache.snapshot()
+    if not cats:
       abort(404)
 
-    return jsonify({
+    response = jsonify({
       'success': True,
       'categories': cats,
-      'total_categories': count
+      'total_categories': len(cats)
     })
+    response.set_etag(version)
+    response.cache_control.public = True
+    response.cache_control.max_age = categories_max_age
+    return response.make_conditional(request)
 
   @app.route('/questions', methods=['GET'])
   def get_questions():
-    page = request.args.get('page', 1, type=int)
-    offset = (page - 1) * QUESTIONS_PER_PAGE
-    q1 = Question.query
-    count = q1.count()
-    if offset > count:
-      abort(404)
-    questions = q1.limit(QUESTIONS_PER_PAGE).offset(offset)
-    cats = Category.query
+    #cursor paging is preferred, page numbers are kept for old clients
+    cursor = request.args.get('cursor')
+    count = question_count.get()
+    if cursor is not None:
+      try:
+        after_id = decode_cursor(cursor)
+      except ValueError:
+        abort(400)
+      questions, next_cursor = fetch_page(
+        Question.query, QUESTIONS_PER_PAGE, after_id=after_id)
+    else:
+      page = request.args.get('page', 1, type=int)
+      offset = (page - 1) * QUESTIONS_PER_PAGE
+      if offset > count:
+        abort(404)
+      questions, next_cursor = fetch_page(
+        Question.query, QUESTIONS_PER_PAGE, offset=offset)
     return jsonify({
       'success': True,
       'questions': [q.format() for q in questions],
       'total_questions': count,
-      'categories': {c.id: c.type for c in cats}
+      'next_cursor': next_cursor,
+      'categories': category_cache.get()
     })
 
   @app.route('/questions/<int:id_>', methods=['DELETE'])
@@ -100,48 +131,53 @@ def create_app(test_config=None):
   @app.route('/questions/search', methods=['POST'])
   def search_question():
     term = request.json.get('searchTerm')
-    if term is None:
+    page = request.json.get('page', 1)
+    if term is None or not isinstance(page, int) or page < 1:
       abort(400)
-    questions = Question.query.filter(Question.question .ilike(f'%{term}%'))
+    total, questions = question_search.search(
+      term, (page - 1) * QUESTIONS_PER_PAGE, QUESTIONS_PER_PAGE)
 
     return jsonify({
       'success': True,
-      'total_questions': questions.count(),
+      'total_questions': total,
       'questions': [q.format() for q in questions]
       })
 
   @app.route('/categories/<int:id_>/questions', methods=['GET'])
   def get_questions_by_category(id_):
-    category = Category.query.get(id_)
+    category = category_cache.format(id_)
     if not category:
       abort(404)
-    questions = Question.query.filter_by(category=id_)
+    questions = Question.query.filter_by(category=id_).all()
 
     return jsonify({
       'success': True,
-      'total_questions': questions.count(),
+      'total_questions': len(questions),
       'questions': [q.format() for q in questions],
-      'current_category': category.format()
+      'current_category': category
       })
 
   @app.route('/quizzes', methods=['POST'])
   def quiz():
-    #i've decided there is no bad request.
-    #They are getting a question whether they
-    #like it or not.
+    #i've decided the only bad request is a category
+    #that isn't a number. They are getting a question
+    #whether they like it or not.
 
     #list of ids
     prevs = request.json.get('previous_questions', [])
-    cat_id = request.json.get('quiz_category')
-
-    filters = [Question.id.notin_(prevs)]
-    if cat_id:
-      filters.append(Question.category == cat_id)
-    query = Question.query.filter(*filters)
+    cat_id = quiz_category(request.json)
 
     question = None
-    if query.count() > 0:
-      question = select_random(query).format()
+    while question is None:
+      id_ = question_index.sample(cat_id, prevs)
+      if id_ is None:
+        break
+      question = Question.query.get(id_)
+      if question is None:
+        #deleted by another process since the index was loaded
+        question_index.remove(id_)
+    if question is not None:
+      question = question.format()
 
     #return result.question -- can be None
     return jsonify({
@@ -149,6 +185,37 @@ def create_app(test_config=None):
       'question': question
       })
 
+  @app.route('/quizzes/sessions', methods=['POST'])
+  def start_quiz():
+    cat_id = quiz_category(request.get_json(silent=True))
+    token, total = start_session(quiz_sessions, cat_id)
+
+    return jsonify({
+      'success': True,
+      'quiz_session': token,
+      'total_questions': total
+      })
+
+  @app.route('/quizzes/sessions/<token>/next', methods=['POST'])
+  def next_quiz_question(token):
+    question = None
+    while question is None:
+      try:
+        id_ = next_question_id(quiz_sessions, token)
+      except KeyError:
+        abort(404)
+      if id_ is None:
+        break
+      #skips questions deleted since the quiz started
+      question = Question.query.get(id_)
+    if question is not None:
+      question = question.format()
+
+    return jsonify({
+      'success': True,
+      'question': question
+      })
+
   @app.errorhandler(400)
   def bad_request(error):
     return jsonify({
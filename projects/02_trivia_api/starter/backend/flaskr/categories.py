@@ -0,0 +1,52 @@
+'''
+Process level cache of the categories table
+
+Categories are read by most endpoints and next to never change, so
+they are read once and kept until invalidate() is called by whatever
+changes them.  version is a digest of the contents, the same in every
+worker holding the same categories, and serves as the ETag.
+'''
+import hashlib
+import json
+import threading
+
+from models import Category
+
+
+class CategoryCache:
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._types = None
+    self._version = None
+
+  def snapshot(self):
+    '''({id: type} of every category, version), the dict not to be modified'''
+    with self._lock:
+      if self._types is None:
+        types = {c.id: c.type for c in Category.query.order_by(Category.id)}
+        digest = hashlib.sha1(json.dumps(sorted(types.items())).encode())
+        self._types = types
+        self._version = digest.hexdigest()[:16]
+      return self._types, self._version
+
+  def get(self):
+    return self.snapshot()[0]
+
+  @property
+  def version(self):
+    return self.snapshot()[1]
+
+  def format(self, id_):
+    '''Category.format() of the category with id_, None if there isn't one'''
+    type_ = self.get().get(id_)
+    if type_ is None:
+      return None
+    return {'id': id_, 'type': type_}
+
+  def invalidate(self):
+    with self._lock:
+      self._types = None
+      self._version = None
+
+
+category_cache = CategoryCache()
@@ -0,0 +1,81 @@
+'''
+Keyset pagination over questions.id
+
+A cursor is an opaque token holding the last id of the page before it.
+The next page is then a range scan on the primary key starting after
+that id, so a deep page costs about the same as the first one instead
+of walking every skipped row the way OFFSET does.
+'''
+import base64
+import binascii
+import threading
+
+from models import Question, on_question_change
+
+
+def encode_cursor(id_):
+  return base64.urlsafe_b64encode(str(id_).encode()).decode()
+
+
+def decode_cursor(cursor):
+  '''raises ValueError if the cursor wasn't made by encode_cursor'''
+  try:
+    return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+  except (binascii.Error, UnicodeError):
+    raise ValueError(f'bad cursor {cursor!r}')
+
+
+def fetch_page(query, per_page, after_id=None, offset=0):
+  '''
+  Return (rows, next_cursor) for one page of query ordered by id.
+  Pages start after after_id when it is given, otherwise at offset.
+  next_cursor is None on the last page.
+  '''
+  query = query.order_by(Question.id)
+  if after_id is not None:
+    query = query.filter(Question.id > after_id)
+  else:
+    query = query.offset(offset)
+  #one extra row tells us whether there is a next page
+  rows = query.limit(per_page + 1).all()
+  next_cursor = None
+  if len(rows) > per_page:
+    rows = rows[:per_page]
+    next_cursor = encode_cursor(rows[-1].id)
+  return rows, next_cursor
+
+
+class RowCount:
+  '''
+  A table's row count, counted once and then adjusted as rows are
+  inserted and deleted so requests don't have to COUNT(*) each time.
+  '''
+  def __init__(self, model):
+    self.model = model
+    self._count = None
+    self._lock = threading.Lock()
+
+  def get(self):
+    with self._lock:
+      if self._count is None:
+        self._count = self.model.query.count()
+      return self._count
+
+  def adjust(self, n):
+    with self._lock:
+      if self._count is not None:
+        self._count += n
+
+  def invalidate(self):
+    with self._lock:
+      self._count = None
+
+
+question_count = RowCount(Question)
+
+@on_question_change
+def _track_question_count(action, question):
+  if action == 'insert':
+    question_count.adjust(1)
+  elif action == 'delete':
+    question_count.adjust(-1)
@@ -0,0 +1,149 @@
+'''
+In memory index of question ids for the quiz
+
+The quiz needs a random question the player hasn't seen yet.  Asking
+the database means a COUNT and an OFFSET scan over a NOT IN filter,
+both growing with the table and with previous_questions.  Instead
+every question id is kept here in an array per category, so a random
+unseen id can be drawn in constant expected time, leaving a single
+primary key lookup for the database.
+'''
+import threading
+from random import randrange
+
+from models import db, Question, on_question_change
+
+
+class IdPool:
+  '''
+  A set of ids that can also be indexed into, giving O(1) add,
+  remove and uniform random choice.
+  '''
+  def __init__(self):
+    self.ids = []
+    self._pos = {}
+
+  def __len__(self):
+    return len(self.ids)
+
+  def __contains__(self, id_):
+    return id_ in self._pos
+
+  def add(self, id_):
+    if id_ not in self._pos:
+      self._pos[id_] = len(self.ids)
+      self.ids.append(id_)
+
+  def remove(self, id_):
+    #swap the last id into the hole
+    i = self._pos.pop(id_, None)
+    if i is None:
+      return
+    last = self.ids.pop()
+    if last != id_:
+      self.ids[i] = last
+      self._pos[last] = i
+
+  def sample(self, exclude=(), randomrange=randrange):
+    '''
+    Return a random id not in exclude, or None if there isn't one.
+    Draws until it misses exclude, which takes n / (n - k) tries on
+    average, so once most of the pool has been seen it falls back
+    to choosing from what is left.
+    '''
+    n = len(self.ids)
+    seen = sum(1 for id_ in exclude if id_ in self._pos)
+    if seen >= n:
+      return None
+    if seen <= n // 2:
+      while True:
+        id_ = self.ids[randomrange(0, n)]
+        if id_ not in exclude:
+          return id_
+    left = [id_ for id_ in self.ids if id_ not in exclude]
+    return left[randomrange(0, len(left))]
+
+
+class QuestionIndex:
+  '''
+  Question ids, all together and by category.  Loaded from the
+  database on first use then kept current by the Question listeners.
+  '''
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._loaded = False
+    self._all = IdPool()
+    self._by_category = {}
+    self._category_of = {}
+
+  def load(self):
+    with self._lock:
+      self._all = IdPool()
+      self._by_category = {}
+      self._category_of = {}
+      for id_, category in db.session.query(Question.id, Question.category):
+        self._add(id_, category)
+      self._loaded = True
+
+  def invalidate(self):
+    with self._lock:
+      self._loaded = False
+
+  def _add(self, id_, category):
+    self._all.add(id_)
+    self._by_category.setdefault(category, IdPool()).add(id_)
+    self._category_of[id_] = category
+
+  def _remove(self, id_):
+    self._all.remove(id_)
+    if id_ in self._category_of:
+      category = self._category_of.pop(id_)
+      self._by_category[category].remove(id_)
+
+  def add(self, id_, category):
+    with self._lock:
+      if self._loaded:
+        self._remove(id_)
+        self._add(id_, category)
+
+  def remove(self, id_):
+    with self._lock:
+      if self._loaded:
+        self._remove(id_)
+
+  def ids(self, category=None):
+    '''a new list of the ids in category, or of all ids if None'''
+    if not self._loaded:
+      self.load()
+    with self._lock:
+      if category is None:
+        return list(self._all.ids)
+      pool = self._by_category.get(category)
+      return list(pool.ids) if pool else []
+
+  def sample(self, category=None, exclude=(), randomrange=randrange):
+    '''
+    Return the id of a random question in category (any category
+    if None) whose id isn't in exclude, or None if all have been used.
+    '''
+    if not self._loaded:
+      self.load()
+    exclude = set(exclude)
+    with self._lock:
+      if category is None:
+        pool = self._all
+      else:
+        pool = self._by_category.get(category)
+        if pool is None:
+          return None
+      return pool.sample(exclude, randomrange)
+
+
+question_index = QuestionIndex()
+
+@on_question_change
+def _track_question_ids(action, question):
+  if action == 'delete':
+    question_index.remove(question.id)
+  else:
+    question_index.add(question.id, question.category)
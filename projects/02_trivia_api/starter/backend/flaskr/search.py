@@ -0,0 +1,192 @@
+'''
+Question search
+
+Searching with ILIKE '%term%' scans the whole table and then scans
+it again for the count.  Two backends replace it, both matching every
+word of the search term as a word prefix in the question or answer
+and ranking the results:
+
+MemorySearch, the default, keeps an inverted index in process.  It is
+built on first use and kept current by the Question listeners.
+
+PostgresSearch leaves the work to postgres full text search.  Choose
+it with SEARCH_BACKEND = 'postgres' in the config given to create_app.
+
+Both return (total, questions) for one page, the total coming from the
+same pass that found the page.
+'''
+import bisect
+import math
+import re
+import threading
+
+from sqlalchemy import func
+
+from models import db, Question, on_question_change
+
+#matches in the question count for more than matches in the answer
+FIELD_WEIGHTS = (('question', 2.0), ('answer', 1.0))
+#a word that is only a prefix match counts for less than a whole one
+PREFIX_WEIGHT = 0.5
+
+_word = re.compile(r'\w+')
+
+
+def tokenize(text):
+  return _word.findall(text.lower()) if text else []
+
+
+class MemorySearch:
+  '''An inverted index from words to the questions containing them.'''
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._loaded = False
+    self._clear()
+
+  def _clear(self):
+    #word: {question id: weight}
+    self._postings = {}
+    #question id: words, to find its postings again on removal
+    self._words_of = {}
+    #every indexed word in order, for finding prefixes
+    self._words = []
+
+  def load(self):
+    with self._lock:
+      self._clear()
+      for question in Question.query:
+        self._add(question)
+      self._loaded = True
+
+  def invalidate(self):
+    with self._lock:
+      self._loaded = False
+
+  def _add(self, question):
+    weights = {}
+    for field, weight in FIELD_WEIGHTS:
+      for word in tokenize(getattr(question, field)):
+        weights[word] = weights.get(word, 0) + weight
+    for word, weight in weights.items():
+      postings = self._postings.get(word)
+      if postings is None:
+        postings = self._postings[word] = {}
+        bisect.insort(self._words, word)
+      postings[question.id] = weight
+    self._words_of[question.id] = list(weights)
+
+  def _remove(self, id_):
+    for word in self._words_of.pop(id_, ()):
+      postings = self._postings[word]
+      del postings[id_]
+      if not postings:
+        del self._postings[word]
+        del self._words[bisect.bisect_left(self._words, word)]
+
+  def add(self, question):
+    with self._lock:
+      if self._loaded:
+        self._remove(question.id)
+        self._add(question)
+
+  def remove(self, id_):
+    with self._lock:
+      if self._loaded:
+        self._remove(id_)
+
+  def _matches(self, term):
+    '''{question id: score} for questions with a word starting with term'''
+    n = len(self._words_of)
+    scores = {}
+    i = bisect.bisect_left(self._words, term)
+    while i < len(self._words) and self._words[i].startswith(term):
+      word = self._words[i]
+      postings = self._postings[word]
+      idf = math.log(1 + n / len(postings))
+      if word != term:
+        idf *= PREFIX_WEIGHT
+      for id_, weight in postings.items():
+        scores[id_] = max(scores.get(id_, 0), weight * idf)
+      i += 1
+    return scores
+
+  def rank(self, text):
+    '''
+    Ids of the questions matching every word of text, best first.
+    No words at all matches everything, in id order.
+    '''
+    if not self._loaded:
+      self.load()
+    terms = tokenize(text)
+    with self._lock:
+      if not terms:
+        return sorted(self._words_of)
+      scores = None
+      for term in terms:
+        matches = self._matches(term)
+        if scores is None:
+          scores = matches
+        else:
+          scores = {id_: s + matches[id_] for id_, s in scores.items() if id_ in matches}
+        if not scores:
+          return []
+    return sorted(scores, key=lambda id_: (-scores[id_], id_))
+
+  def search(self, text, offset, limit):
+    ids = self.rank(text)
+    page = ids[offset:offset + limit]
+    questions = {q.id: q for q in Question.query.filter(Question.id.in_(page))}
+    #anything deleted by another process since the index was loaded
+    #is just left out
+    return len(ids), [questions[id_] for id_ in page if id_ in questions]
+
+
+class PostgresSearch:
+  '''
+  Full text search done by postgres.  Uses the 'simple' text search
+  configuration so that, like MemorySearch, words aren't stemmed and
+  nothing is dropped as a stop word.
+  An expression index keeps it from scanning the table:
+    CREATE INDEX questions_search ON questions USING gin
+      (to_tsvector('simple', coalesce(question, '') || ' ' || coalesce(answer, '')));
+  '''
+  document = func.to_tsvector(
+    'simple',
+    func.coalesce(Question.question, '') + ' ' + func.coalesce(Question.answer, ''))
+
+  def search(self, text, offset, limit):
+    terms = tokenize(text)
+    query = db.session.query(Question)
+    order = [Question.id]
+    if terms:
+      #\w+ words can't contain tsquery operators
+      tsquery = func.to_tsquery('simple', ' & '.join(f'{t}:*' for t in terms))
+      query = query.filter(self.document.op('@@')(tsquery))
+      order.insert(0, func.ts_rank(self.document, tsquery).desc())
+    rows = query.add_columns(func.count().over().label('total')).\
+                 order_by(*order).\
+                 offset(offset).\
+                 limit(limit).\
+                 all()
+    if rows:
+      total = rows[0].total
+    elif offset:
+      #past the last page there is no row to carry the count
+      total = query.count()
+    else:
+      total = 0
+    return total, [row.Question for row in rows]
+
+
+question_search = MemorySearch()
+
+@on_question_change
+def _track_question_text(action, question):
+  if action == 'delete':
+    question_search.remove(question.id)
+  else:
+    question_search.add(question)
+
+
+def search_backend(name):
+  return {'memory': question_search, 'postgres': PostgresSearch()}[name]
@@ -0,0 +1,97 @@
+'''
+Server side quiz sessions
+
+Starting a quiz shuffles the ids of every eligible question once and
+keeps that permutation under a random token.  Each next question pops
+an id off it, so the client no longer echoes previous_questions back
+and the database only ever sees a primary key lookup.
+
+Sessions live in a store with get(token), set(token, ids) and
+delete(token).  MemorySessionStore is the in process default, anything
+else with those methods (a redis wrapper say) can be passed to
+create_app as the QUIZ_SESSION_STORE config value.  Stores should
+forget sessions on their own after a while.
+'''
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from random import shuffle
+
+from .quiz import question_index
+
+
+class MemorySessionStore:
+  '''
+  Keeps at most max_sessions sessions, dropping the least recently
+  used when full and any that haven't been touched in ttl seconds.
+  '''
+  def __init__(self, max_sessions=10000, ttl=3600, clock=time.monotonic):
+    self.max_sessions = max_sessions
+    self.ttl = ttl
+    self.clock = clock
+    self._lock = threading.Lock()
+    #token: (expires, ids), least recently used first
+    self._sessions = OrderedDict()
+
+  def __len__(self):
+    with self._lock:
+      self._expire()
+      return len(self._sessions)
+
+  def _expire(self):
+    #every access pushes its session to the back with a fresh expiry
+    #so the expired ones are all at the front
+    now = self.clock()
+    while self._sessions:
+      token, (expires, _) = next(iter(self._sessions.items()))
+      if expires > now:
+        break
+      del self._sessions[token]
+
+  def get(self, token):
+    with self._lock:
+      self._expire()
+      entry = self._sessions.get(token)
+      if entry is None:
+        return None
+      ids = entry[1]
+      self._sessions[token] = (self.clock() + self.ttl, ids)
+      self._sessions.move_to_end(token)
+      return ids
+
+  def set(self, token, ids):
+    with self._lock:
+      self._expire()
+      self._sessions[token] = (self.clock() + self.ttl, ids)
+      self._sessions.move_to_end(token)
+      while len(self._sessions) > self.max_sessions:
+        self._sessions.popitem(last=False)
+
+  def delete(self, token):
+    with self._lock:
+      self._sessions.pop(token, None)
+
+
+def start_session(store, category=None):
+  '''Return (token, number of questions) for a new quiz.'''
+  ids = question_index.ids(category)
+  shuffle(ids)
+  token = secrets.token_urlsafe(16)
+  store.set(token, ids)
+  return token, len(ids)
+
+
+def next_question_id(store, token):
+  '''
+  Pop the next question id for the session, None once the quiz is
+  over.  Raises KeyError for an unknown or expired token.
+  '''
+  ids = store.get(token)
+  if ids is None:
+    raise KeyError(token)
+  if not ids:
+    return None
+  id_ = ids.pop()
+  store.set(token, ids)
+  return id_
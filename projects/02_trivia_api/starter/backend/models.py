@@ -3,6 +3,8 @@ from sqlalchemy import Column, String, Integer, create_engine
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from dbengine import configure_engine
+
 database_name = "trivia"
 database_path = "postgres://{}/{}".format('localhost:5432', database_name)
 
@@ -11,18 +13,33 @@ db = SQLAlchemy()
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    the tables aren't created here, load them from trivia.psql
+    (or call db.create_all()) once rather than on every app
 '''
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    configure_engine(app)
     db.app = app
     db.init_app(app)
-    db.create_all()
 
 
 def rollback():
   db.session.rollback()
 
+'''
+on_question_change(listener)
+    registers listener(action, question) to be called after a
+    Question insert(), update() or delete() has been committed,
+    action being the name of the method.
+    Used to keep in process caches in step with the table.
+'''
+question_listeners = []
+
+def on_question_change(listener):
+  question_listeners.append(listener)
+  return listener
+
 '''
 Question
 
@@ -46,13 +63,20 @@ class Question(db.Model):
   def insert(self):
     db.session.add(self)
     db.session.commit()
+    self._notify('insert')
 
   def update(self):
     db.session.commit()
+    self._notify('update')
 
   def delete(self):
     db.session.delete(self)
     db.session.commit()
+    self._notify('delete')
+
+  def _notify(self, action):
+    for listener in question_listeners:
+      listener(action, self)
 
 
   def format(self):
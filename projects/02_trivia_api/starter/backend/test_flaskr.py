@@ -1,11 +1,13 @@
 import os
 import unittest
 import json
+from unittest import mock
 from flask_sqlalchemy import SQLAlchemy
 from pprint import pprint
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.sessions import MemorySessionStore
+from models import setup_db, database_path, Question, Category
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -42,6 +44,41 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(result.json["total_categories"])
         self.assertTrue(len(result.json["categories"]) > 0)
 
+    def test_get_categories_conditional(self):
+        result = self.client().get('/categories')
+        etag = result.headers['ETag']
+        self.assertTrue(etag)
+        self.assertIn('max-age', result.headers['Cache-Control'])
+        result = self.client().get('/categories',
+                                   headers={'If-None-Match': etag})
+        self.assertEqual(result.status_code, 304)
+        self.assertFalse(result.data)
+
+    def test_metrics(self):
+        client = self.client()
+        client.get('/categories')
+        client.get('/questions')
+        result = client.get('/metrics')
+        self.assertEqual(result.status_code, 200)
+        text = result.data.decode()
+        self.assertIn('flask_requests_total{endpoint="get_categories",status="200"} 1', text)
+        self.assertIn('flask_request_queries_count{endpoint="get_questions"} 1', text)
+
+    def test_engine_options(self):
+        app = create_app()
+        environ = {'DB_POOL_SIZE': '3', 'DB_POOL_PRE_PING': 'yes', 'DB_STATEMENT_TIMEOUT_MS': '5000'}
+        with mock.patch.dict(os.environ, environ):
+            setup_db(app, database_path)
+        options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+        self.assertEqual(options['pool_size'], 3)
+        self.assertIs(options['pool_pre_ping'], True)
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=5000'})
+        self.assertIn('pool_stats', app.extensions)
+        # sqlite keeps its own pool
+        with mock.patch.dict(os.environ, environ):
+            setup_db(app, 'sqlite://')
+        self.assertEqual(app.config['SQLALCHEMY_ENGINE_OPTIONS'], {'pool_pre_ping': True})
+
     def test_get_questions(self):
         result1 = self.client().get('/questions')
         result2 = self.client().get('/questions?page=2')
@@ -56,6 +93,28 @@ class TriviaTestCase(unittest.TestCase):
         result = self.client().get('/questions?page=1000')
         self.assertTrue(result.status_code, 404)
 
+    def test_get_questions_by_cursor(self):
+        '''
+        Following next_cursor from the first page should visit
+        every question exactly once.
+        '''
+        result = self.client().get('/questions')
+        seen = [q['id'] for q in result.json['questions']]
+        cursor = result.json['next_cursor']
+        while cursor:
+            result = self.client().get(f'/questions?cursor={cursor}')
+            self.assertEqual(result.status_code, 200)
+            seen.extend(q['id'] for q in result.json['questions'])
+            cursor = result.json['next_cursor']
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(set(seen), {q.id for q in Question.query})
+        self.assertEqual(result.json['total_questions'], len(seen))
+
+    def test_get_questions_bad_cursor(self):
+        result = self.client().get('/questions?cursor=notacursor')
+        self.assertEqual(result.status_code, 400)
+        self.assertFalse(result.json['success'])
+
     def test_delete_question(self):
         q2 = Question.query.get(2)
         self.assertTrue(q2)
@@ -130,6 +189,44 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(result2.json['total_questions'] > 0)
         self.assertTrue(len(result2.json['questions']) > 0)
 
+    def test_search_question_prefix_and_answer(self):
+        #'pain' is a prefix of 'paintings' and 'painting', 'escher' only an answer
+        result = self.client().post('/questions/search', json={'searchTerm': 'pain'})
+        self.assertEqual(result.status_code, 200)
+        ids = {q['id'] for q in result.json['questions']}
+        self.assertTrue({18, 19} <= ids)
+        result = self.client().post('/questions/search', json={'searchTerm': 'Escher'})
+        self.assertEqual([q['id'] for q in result.json['questions']], [16])
+
+    def test_search_question_pages(self):
+        search = {'searchTerm': ''}
+        result = self.client().post('/questions/search', json=search)
+        total = result.json['total_questions']
+        self.assertEqual(total, Question.query.count())
+        self.assertEqual(len(result.json['questions']), min(total, 10))
+        search['page'] = 2
+        result = self.client().post('/questions/search', json=search)
+        self.assertEqual(result.json['total_questions'], total)
+        self.assertEqual(len(result.json['questions']), min(total - 10, 10))
+        search['page'] = 0
+        result = self.client().post('/questions/search', json=search)
+        self.assertEqual(result.status_code, 400)
+
+    def test_search_sees_added_questions(self):
+        search = {'searchTerm': 'zymurgy'}
+        result = self.client().post('/questions/search', json=search)
+        self.assertEqual(result.json['total_questions'], 0)
+        newq = {
+            'question': 'What is the study of fermentation called?',
+            'answer': 'Zymurgy',
+            'category': 1,
+            'difficulty': 5
+        }
+        self.client().post('/questions/add', json=newq)
+        result = self.client().post('/questions/search', json=search)
+        self.assertEqual(result.json['total_questions'], 1)
+        self.assertEqual(result.json['questions'][0]['answer'], 'Zymurgy')
+
     def test_get_question_by_category(self):
         #six categories
         category = 3
@@ -178,6 +275,83 @@ class TriviaTestCase(unittest.TestCase):
         for c in Category.query:
             self.test_quiz(category_id=c.id)
 
+    def test_quiz_sees_added_and_deleted_questions(self):
+        '''
+        The quiz draws from an in memory id index, make sure
+        it follows questions being added and deleted.
+        '''
+        category = 1
+        prevs = [q.id for q in Question.query.filter_by(category=category)]
+        json = {'previous_questions': prevs, 'quiz_category': category}
+        result = self.client().post('/quizzes', json=json)
+        self.assertIsNone(result.json['question'])
+
+        newq = {
+            'question': 'What is the airspeed velocity of an unladen swallow?',
+            'answer': 'African or European?',
+            'category': category,
+            'difficulty': 5
+        }
+        self.client().post('/questions/add', json=newq)
+        result = self.client().post('/quizzes', json=json)
+        question = result.json['question']
+        self.assertEqual(question['answer'], newq['answer'])
+
+        self.client().delete(f'/questions/{question["id"]}')
+        result = self.client().post('/quizzes', json=json)
+        self.assertIsNone(result.json['question'])
+
+    def test_quiz_session(self):
+        '''
+        A quiz session should hand out every question in
+        its category once and then None.
+        '''
+        category = 2
+        result = self.client().post('/quizzes/sessions',
+                                    json={'quiz_category': category})
+        self.assertEqual(result.status_code, 200)
+        token = result.json['quiz_session']
+        total = result.json['total_questions']
+        seen = []
+        while True:
+            result = self.client().post(f'/quizzes/sessions/{token}/next')
+            self.assertEqual(result.status_code, 200)
+            question = result.json['question']
+            if not question:
+                break
+            self.assertEqual(question['category'], category)
+            seen.append(question['id'])
+        self.assertEqual(len(seen), total)
+        self.assertEqual(set(seen),
+                         {q.id for q in Question.query.filter_by(category=category)})
+
+    def test_quiz_session_unknown(self):
+        result = self.client().post('/quizzes/sessions/nosuchsession/next')
+        self.assertEqual(result.status_code, 404)
+        self.assertFalse(result.json['success'])
+
+    def test_quiz_session_store_evicts(self):
+        now = [0]
+        store = MemorySessionStore(max_sessions=2, ttl=10, clock=lambda: now[0])
+        store.set('a', [1])
+        store.set('b', [2])
+        store.set('c', [3])
+        #over the limit, least recently used goes
+        self.assertIsNone(store.get('a'))
+        self.assertEqual(store.get('b'), [2])
+        now[0] = 5
+        self.assertEqual(store.get('c'), [3])
+        #b was last touched at 0
+        now[0] = 12
+        self.assertIsNone(store.get('b'))
+        self.assertEqual(store.get('c'), [3])
+        self.assertEqual(len(store), 1)
+
+    def test_quiz_bad_category(self):
+        json = {'previous_questions': [], 'quiz_category': 'science'}
+        result = self.client().post('/quizzes', json=json)
+        self.assertEqual(result.status_code, 400)
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
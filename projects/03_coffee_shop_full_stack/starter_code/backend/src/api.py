@@ -1,15 +1,22 @@
+import os
 import pprint
 import sys
-import json
 from flask import Flask, request, jsonify, abort
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink, rollback
+from .database.models import db_drop_and_create_all, setup_db, Drink, rollback, menu
 from .auth.auth import AuthError, requires_auth
+from .instrument import Instrumentation
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app)
+Instrumentation(app)
+
+#how long clients may use their copy of the menu before asking again
+DRINKS_MAX_AGE = int(os.environ.get('DRINKS_MAX_AGE', 60))
+#how long before the menu version is read again for changes by other workers
+menu.ttl = float(os.environ.get('MENU_TTL', menu.ttl))
 
 
 # !! NOTE THIS WILL DROP ALL RECORDS AND START YOUR DB FROM SCRATCH
@@ -19,24 +26,35 @@ db_drop_and_create_all()
 
 ## ROUTES
 
+def menu_not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    since = request.if_modified_since
+    return since is not None and since.replace(tzinfo=None) >= last_modified
+
+
 #there is no way for it to fail other than 500 afaik
+#both listings are served from the menu's serialized copy
+#the etag and last modified time come from the menu's version, so a
+#client with an up to date copy gets a 304 without reading the drinks
 @app.route('/drinks', methods=['GET'])
 def get_drinks():
-    drinks = [d.short() for d in Drink.query]
-    return jsonify({
-        "success": True,
-        "drinks": drinks
-    }), 200
+    etag, last_modified = menu.validators()
+    if menu_not_modified(etag, last_modified):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(menu.json('short'), mimetype='application/json')
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = DRINKS_MAX_AGE
+    return response
 
 
 @app.route('/drinks-detail', methods=['GET'])
 @requires_auth('get:drinks-detail')
 def drinks_detail(jwt):
-    drinks = [d.long() for d in Drink.query]
-    return jsonify({
-        "success": True,
-        "drinks": drinks
-    }), 200
+    return app.response_class(menu.json('long'), mimetype='application/json'), 200
 
 
 @app.route('/drinks', methods=['POST'])
@@ -47,13 +65,12 @@ def post_drinks(jwt):
     pprint.pprint(data)
     title = data.get('title')
     recipe = data.get('recipe')
-    #don't accept drink entries without all fields filled
-    if not (title and recipe):
-        abort(422)
-    if not all(all(ingredient.values()) for ingredient in recipe):
+    #don't accept drink entries without all fields filled,
+    #the recipe is checked by the model
+    if not title:
         abort(422)
     try:
-        drink = Drink(title=title, recipe=json.dumps(recipe))
+        drink = Drink(title=title, recipe=recipe)
         drink.insert()
     except Exception:
         rollback()
@@ -79,11 +96,11 @@ def patch_drinks(jwt, id_):
     pprint.pprint(data)
     title = data.get('title')
     recipe = data.get('recipe')
-    if title:
-        drink.title = title
-    if recipe:
-        drink.recipe = json.dumps(recipe)
     try:
+        if title:
+            drink.title = title
+        if recipe:
+            drink.recipe = recipe
         drink.insert()
     except Exception:
         rollback()
@@ -1,14 +1,32 @@
-import json
-from urllib.request import urlopen
+import os
 from functools import wraps
 from flask import request, _request_ctx_stack
 from jose import jwt
 
+from .jwks import KeyStore, url_source, file_source
+from .tokens import TokenCache
+
 
 AUTH0_DOMAIN = 'cleverpiggy.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'coffeeshop'
 
+#Signing keys are fetched once and refreshed in the background.
+#Set JWKS_FILE to the path of a saved jwks.json to work offline.
+JWKS_URL = "https://"+AUTH0_DOMAIN+"/.well-known/jwks.json"
+JWKS_TTL = int(os.environ.get('JWKS_TTL', 3600))
+
+if os.environ.get('JWKS_FILE'):
+    jwks_source = file_source(os.environ['JWKS_FILE'])
+else:
+    jwks_source = url_source(JWKS_URL)
+signing_keys = KeyStore(jwks_source, ttl=JWKS_TTL)
+
+#Verified tokens, see tokens.py.  TOKEN_CACHE_SIZE=0 turns it off.
+token_cache = TokenCache(int(os.environ.get('TOKEN_CACHE_SIZE', 1024)))
+#a token signed by a key that has gone has to be checked again
+signing_keys.listeners.append(token_cache.clear)
+
 ## AuthError Exception
 
 # AuthError Exception
@@ -45,8 +63,10 @@ def get_token_auth_header():
     return token
 
 
-def check_permissions(permission, payload):
-    permissions = payload.get('permissions')
+def check_permissions(permission, payload, permissions=None):
+    #permissions can be passed in already made into a set
+    if permissions is None:
+        permissions = payload.get('permissions')
     if permissions is None:
         raise AuthError({
             'code': 'invalid_claims',
@@ -63,10 +83,13 @@ def check_permissions(permission, payload):
 #https://stackoverflow.com/questions/50236117/
 #scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
 def verify_decode_jwt(token):
-    token = get_token_auth_header()
-    jsonurl = urlopen("https://"+AUTH0_DOMAIN+"/.well-known/jwks.json")
-    jwks = json.loads(jsonurl.read())
-    unverified_header = jwt.get_unverified_header(token)
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except Exception:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 401)
     rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
@@ -74,15 +97,15 @@ def verify_decode_jwt(token):
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks["keys"]:
-        if key["kid"] == unverified_header["kid"]:
-            rsa_key = {
-                "kty": key["kty"],
-                "kid": key["kid"],
-                "use": key["use"],
-                "n": key["n"],
-                "e": key["e"]
-            }
+    key = signing_keys.get(unverified_header["kid"])
+    if key is not None:
+        rsa_key = {
+            "kty": key["kty"],
+            "kid": key["kid"],
+            "use": key["use"],
+            "n": key["n"],
+            "e": key["e"]
+        }
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -123,8 +146,20 @@ def requires_auth(permission=''):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            cached = token_cache.get(token)
+            #a cached token is only good while the key that signed it is,
+            #and looking the key up keeps the key store refreshing, which
+            #empties the cache when a key is rotated out
+            if cached is not None and signing_keys.get(cached[0]) is None:
+                token_cache.discard(token)
+                cached = None
+            if cached is None:
+                payload = verify_decode_jwt(token)
+                kid = jwt.get_unverified_header(token)['kid']
+                permissions = token_cache.set(token, kid, payload)
+            else:
+                kid, payload, permissions = cached
+            check_permissions(permission, payload, permissions)
             return f(payload, *args, **kwargs)
 
         return wrapper
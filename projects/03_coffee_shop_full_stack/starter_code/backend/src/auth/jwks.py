@@ -0,0 +1,120 @@
+import json
+import sys
+import threading
+import time
+from urllib.request import urlopen
+
+
+## JWKS sources
+# A source is any function returning the parsed JWKS document,
+# {"keys": [{"kid": ..., "kty": ..., ...}, ...]}
+
+def url_source(url, timeout=10):
+    def fetch():
+        with urlopen(url, timeout=timeout) as response:
+            return json.loads(response.read())
+    return fetch
+
+
+def file_source(path):
+    '''
+    Read the keys from a local file, for working and testing offline.
+    The file is reread on every fetch so it can be edited to rotate keys.
+    '''
+    def fetch():
+        with open(path) as f:
+            return json.load(f)
+    return fetch
+
+
+def static_source(jwks):
+    return lambda: jwks
+
+
+## Key store
+
+class KeyStore:
+    '''
+    Signing keys by kid, fetched from source and kept for ttl seconds.
+
+    Once they're older than that the old keys keep being used while a
+    background thread fetches new ones, so requests never wait on the
+    network except for the very first one.  A kid that isn't known
+    triggers an immediate refetch, in case the keys were rotated, but
+    at most once every min_refetch seconds so made up kids can't be
+    used to hammer the source.
+
+    Functions in listeners are called with no arguments whenever a
+    fetch changes or drops a key that was already known.
+
+    Fetches made while a request waits happen under the lock, so
+    concurrent requests for an unknown kid share a single fetch.
+    '''
+    def __init__(self, source, ttl=3600, min_refetch=30, clock=time.monotonic):
+        self.source = source
+        self.ttl = ttl
+        self.min_refetch = min_refetch
+        self.clock = clock
+        self.fetches = 0
+        self._keys = None
+        self._fetched_at = None
+        # reentrant, _fetch takes it again when called under it
+        self._lock = threading.RLock()
+        self._refreshing = False
+        self.listeners = []
+
+    def _fetch(self):
+        jwks = self.source()
+        keys = {key['kid']: key for key in jwks['keys']}
+        with self._lock:
+            old, self._keys = self._keys, keys
+            self._fetched_at = self.clock()
+            self.fetches += 1
+        if old and any(keys.get(kid) != key for kid, key in old.items()):
+            for listener in self.listeners:
+                listener()
+
+    def _refresh_in_background(self):
+        def refresh():
+            try:
+                self._fetch()
+            except Exception:
+                #keep using the keys we have, the next request tries again
+                print('JWKS refresh failed', sys.exc_info())
+            finally:
+                self._refreshing = False
+
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _fetch_unless_newer(self, fetched_at):
+        '''
+        Fetch the keys unless another thread has fetched them since
+        fetched_at, and return (keys, when they were fetched).
+        '''
+        with self._lock:
+            if self._keys is None or self._fetched_at == fetched_at:
+                self._fetch()
+            return self._keys, self._fetched_at
+
+    def get(self, kid):
+        '''Return the key with this kid, or None if the source doesn't have it.'''
+        with self._lock:
+            keys, fetched_at = self._keys, self._fetched_at
+        if keys is None:
+            keys, fetched_at = self._fetch_unless_newer(None)
+        age = self.clock() - fetched_at
+        if age > self.ttl:
+            self._refresh_in_background()
+        key = keys.get(kid)
+        if key is None and age > self.min_refetch:
+            keys, fetched_at = self._fetch_unless_newer(fetched_at)
+            key = keys.get(kid)
+        return key
+
+    def clear(self):
+        with self._lock:
+            self._keys = self._fetched_at = None
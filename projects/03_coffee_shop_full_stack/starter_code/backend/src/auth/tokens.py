@@ -0,0 +1,71 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenCache:
+    '''
+    Payloads of tokens that have already been verified, so a client
+    sending the same token over and over only pays for checking the
+    signature once.
+
+    Entries are keyed by a hash of the token, so the cache never holds
+    usable credentials, and are dropped at the token's exp.  Tokens
+    without an exp aren't cached.  Each entry also keeps the kid of the
+    key that signed the token, so the caller can check the key is still
+    current, and the token's permissions as a frozenset for
+    check_permissions.  max_entries of 0 turns the cache off.
+    '''
+    def __init__(self, max_entries=1024, clock=time.time):
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        #token hash: (exp, kid, payload, permissions), least recently used first
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        '''Return (kid, payload, permissions) or None.'''
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self.clock():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1:]
+
+    def set(self, token, kid, payload):
+        '''Cache payload for token, signed by key kid, and return its permissions.'''
+        permissions = payload.get('permissions')
+        if permissions is not None:
+            permissions = frozenset(permissions)
+        exp = payload.get('exp')
+        if self.max_entries and isinstance(exp, (int, float)):
+            key = self._key(token)
+            with self._lock:
+                self._entries[key] = (exp, kid, payload, permissions)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return permissions
+
+    def discard(self, token):
+        with self._lock:
+            self._entries.pop(self._key(token), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,169 @@
+#Database engine and connection pool settings for the Flask apps in this repo.
+#
+#  configure_engine(app)    once SQLALCHEMY_DATABASE_URI is set, before
+#                           the first query
+#
+#Each setting is read from the environment, then from app.config, and
+#left to SQLAlchemy when neither has it:
+#  DB_POOL_SIZE             connections the pool keeps open (5)
+#  DB_MAX_OVERFLOW          connections it may open past that under load (10)
+#  DB_POOL_TIMEOUT          seconds to wait for a free connection (30)
+#  DB_POOL_RECYCLE          seconds before a connection is replaced (never)
+#  DB_POOL_PRE_PING         test connections before handing them out (no)
+#  DB_STATEMENT_TIMEOUT_MS  postgres statement_timeout (none)
+#  DB_POOL_LOG_INTERVAL     seconds between pool stats lines, 0 for none (60)
+#
+#Size, overflow and timeout only apply to the queue pool server databases
+#get, sqlite keeps the pool Flask-SQLAlchemy picks for it.  The queue pool
+#is measured: every DB_POOL_LOG_INTERVAL seconds with checkouts, one line
+#of JSON on the '<app name>.pool' logger gives the number of checkouts,
+#the time they waited for a connection (opening one included), the most
+#connections checked out at once, and how many overflow connections were
+#opened and checkouts timed out.  Timeouts are also logged as they happen.
+#app.extensions['pool_stats'].snapshot() has the counts since the last line.
+#
+#The projects are deployed on their own, so each one carries an
+#identical copy of this file.  Change them together.
+
+import json
+import logging
+import os
+import threading
+from time import monotonic, perf_counter
+
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+def _number(value):
+  return float(value) if '.' in str(value) else int(value)
+
+
+def _flag(value):
+  if isinstance(value, bool):
+    return value
+  if str(value).lower() in ('1', 'true', 'yes', 'on'):
+    return True
+  if str(value).lower() in ('0', 'false', 'no', 'off', ''):
+    return False
+  raise ValueError(f'{value!r} is not yes or no')
+
+
+#setting: (create_engine argument, parser, queue pool only)
+POOL_SETTINGS = {
+  'DB_POOL_SIZE': ('pool_size', int, True),
+  'DB_MAX_OVERFLOW': ('max_overflow', int, True),
+  'DB_POOL_TIMEOUT': ('pool_timeout', _number, True),
+  'DB_POOL_RECYCLE': ('pool_recycle', int, False),
+  'DB_POOL_PRE_PING': ('pool_pre_ping', _flag, False),
+}
+
+
+def setting(app, name, parse):
+  """name from the environment or app.config, parsed, None if neither."""
+  value = os.environ.get(name)
+  if value is None:
+    value = app.config.get(name)
+  if value is None:
+    return None
+  try:
+    return parse(value)
+  except ValueError as error:
+    raise ValueError(f'{name}={value!r}: {error}') from None
+
+
+def configure_engine(app):
+  """Replace app's SQLALCHEMY_ENGINE_OPTIONS with the DB_ settings."""
+  url = make_url(app.config.get('SQLALCHEMY_DATABASE_URI') or 'sqlite://')
+  #the dialect's name, SQLAlchemy 1.3 names postgres:// urls' backend 'postgres'
+  backend = url.get_dialect().name
+  options = {}
+  for name, (argument, parse, queue_pool_only) in POOL_SETTINGS.items():
+    value = setting(app, name, parse)
+    if value is not None and (backend != 'sqlite' or not queue_pool_only):
+      options[argument] = value
+
+  timeout = setting(app, 'DB_STATEMENT_TIMEOUT_MS', int)
+  if timeout is not None and backend == 'postgresql':
+    options['connect_args'] = {'options': f'-c statement_timeout={timeout}'}
+
+  if backend != 'sqlite':
+    interval = setting(app, 'DB_POOL_LOG_INTERVAL', _number)
+    stats = PoolStats(logging.getLogger(f'{app.name}.pool'), 60 if interval is None else interval)
+    #a subclass per app, create_engine only passes the pool its own arguments
+    options['poolclass'] = type('MeasuredPool', (MeasuredPool,), {'stats': stats})
+    app.extensions['pool_stats'] = stats
+  app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+#----------------------------------------------------------------------------#
+# Pool metrics.
+#----------------------------------------------------------------------------#
+
+class PoolStats:
+  """Checkouts from one pool, logged every interval seconds."""
+  def __init__(self, logger, interval=60, clock=monotonic):
+    self.logger = logger
+    self.interval = interval
+    self.clock = clock
+    self._lock = threading.Lock()
+    self._since = clock()
+    self._counts = self._zero()
+
+  @staticmethod
+  def _zero():
+    return {'checkouts': 0, 'wait_ms': 0.0, 'max_wait_ms': 0.0,
+            'max_checked_out': 0, 'overflows': 0, 'timeouts': 0}
+
+  def snapshot(self):
+    """The counts since the last stats line."""
+    with self._lock:
+      return dict(self._counts)
+
+  def checked_out(self, pool, wait, overflowed):
+    checked_out = pool.checkedout()
+    with self._lock:
+      counts = self._counts
+      counts['checkouts'] += 1
+      counts['wait_ms'] += wait * 1000
+      counts['max_wait_ms'] = max(counts['max_wait_ms'], wait * 1000)
+      counts['max_checked_out'] = max(counts['max_checked_out'], checked_out)
+      counts['overflows'] += overflowed
+      now = self.clock()
+      if not self.interval or now < self._since + self.interval:
+        return
+      line = dict(counts, seconds=round(now - self._since), checked_out=checked_out,
+                  pool_size=pool.size())
+      self._since = now
+      self._counts = self._zero()
+    line['wait_ms'] = round(line['wait_ms'], 2)
+    line['max_wait_ms'] = round(line['max_wait_ms'], 2)
+    level = logging.WARNING if line['overflows'] or line['timeouts'] else logging.INFO
+    self.logger.log(level, json.dumps(line))
+
+  def timed_out(self, pool, wait):
+    with self._lock:
+      self._counts['timeouts'] += 1
+    self.logger.warning(json.dumps({
+      'timed_out_after_ms': round(wait * 1000, 2),
+      'checked_out': pool.checkedout(),
+      'pool_size': pool.size(),
+    }))
+
+
+class MeasuredPool(QueuePool):
+  """A QueuePool that reports its checkouts to stats."""
+  stats = None
+
+  def _do_get(self):
+    overflow = self.overflow()
+    start = perf_counter()
+    try:
+      connection = super()._do_get()
+    except PoolTimeoutError:
+      self.stats.timed_out(self, perf_counter() - start)
+      raise
+    #overflow counts connections past pool_size, negative until it's full
+    overflowed = self.overflow() > max(overflow, 0)
+    self.stats.checked_out(self, perf_counter() - start, overflowed)
+    return connection
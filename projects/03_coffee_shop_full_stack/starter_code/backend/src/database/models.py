@@ -1,8 +1,16 @@
 import os
-from sqlalchemy import Column, String, Integer
+import threading
+import time
+from datetime import datetime
+from numbers import Real
+from sqlalchemy import Column, String, Integer, DateTime, JSON, event
+from sqlalchemy.orm import Session, object_session, validates
+from flask import json as flask_json
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from .dbengine import configure_engine
+
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
 database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
@@ -16,6 +24,7 @@ setup_db(app)
 def setup_db(app):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    configure_engine(app)
     db.app = app
     db.init_app(app)
 
@@ -28,11 +37,70 @@ db_drop_and_create_all()
 def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
+    db.session.add(MenuVersion(id=1, version=0, changed_at=_now()))
+    db.session.commit()
+    menu.expire()
 
 
 def rollback():
     db.session.rollback()
 
+'''
+compile_validator(fields)
+    turns {field name: clean} into a function that raises ValueError
+    unless it's given a non-empty list of dicts with exactly those
+    fields, and returns the list with each field passed through its
+    clean, which returns the value to store or raises ValueError
+    the field names and cleans are looked up once here rather than on
+    every ingredient
+'''
+def compile_validator(fields):
+    names = frozenset(fields)
+    cleans = tuple(fields.items())
+
+    def validate(entries):
+        if not isinstance(entries, list) or not entries:
+            raise ValueError('expected a non-empty list')
+        cleaned = []
+        for i, entry in enumerate(entries):
+            if not isinstance(entry, dict) or entry.keys() != names:
+                raise ValueError(
+                    f'entry {i} must have exactly the fields {sorted(names)}')
+            clean_entry = {}
+            for name, clean in cleans:
+                try:
+                    clean_entry[name] = clean(entry[name])
+                except ValueError:
+                    raise ValueError(f'entry {i} has a bad {name}') from None
+            cleaned.append(clean_entry)
+        return cleaned
+    return validate
+
+
+def _non_empty_string(value):
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(value)
+    return value
+
+
+def _positive_number(value):
+    # the frontend's number inputs send their values as strings
+    if isinstance(value, str):
+        try:
+            value = int(value)
+        except ValueError:
+            value = float(value)
+    if not isinstance(value, Real) or isinstance(value, bool) or not 0 < value < float('inf'):
+        raise ValueError(value)
+    return value
+
+
+validate_recipe = compile_validator({
+    'name': _non_empty_string,
+    'color': _non_empty_string,
+    'parts': _positive_number
+})
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -42,21 +110,37 @@ class Drink(db.Model):
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     # String Title
     title = Column(String(80), unique=True)
-    # the ingredients blob - this stores a lazy json blob
+    # the ingredients, stored as json and handed back as python lists
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
-    recipe =  Column(String(180), nullable=False)
+    # assign a new list to change it, changes made in place aren't saved
+    recipe =  Column(JSON, nullable=False)
+
+    @validates('recipe')
+    def _validate_recipe(self, key, recipe):
+        return validate_recipe(recipe)
+
+    '''
+    recipe_forms()
+        the recipe and its short form, as a tuple
+        the short form is worked out once for each recipe the drink has,
+        whether it came from the database or was just set
+    '''
+    def recipe_forms(self):
+        if getattr(self, '_forms_of', None) is not self.recipe:
+            short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in self.recipe]
+            self._forms = (self.recipe, short_recipe)
+            self._forms_of = self.recipe
+        return self._forms
 
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': short_recipe
+            'recipe': self.recipe_forms()[1]
         }
 
     '''
@@ -67,7 +151,7 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.recipe_forms()[0]
         }
 
     '''
@@ -78,6 +162,7 @@ class Drink(db.Model):
         EXAMPLE
             drink = Drink(title=req_title, recipe=req_recipe)
             drink.insert()
+        setting a recipe that isn't valid raises ValueError
     '''
     def insert(self):
         db.session.add(self)
@@ -109,3 +194,124 @@ class Drink(db.Model):
 
     def __repr__(self):
         return json.dumps(self.short())
+
+
+def _now():
+    # utc, to the second, as http dates go
+    return datetime.utcnow().replace(microsecond=0)
+
+
+'''
+MenuVersion
+    the one row (id 1) saying which version of the menu is current
+    version goes up with every drink inserted, updated or deleted, in the
+    same transaction, and changed_at is when
+    it lives in the database so every worker agrees on it
+'''
+class MenuVersion(db.Model):
+    __tablename__ = 'menu_version'
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    changed_at = Column(DateTime, nullable=False)
+
+
+'''
+Menu
+    the /drinks and /drinks-detail responses, serialized once and kept
+    while the menu version stays the same
+    the version row is read again at most every ttl seconds, so another
+    worker's change shows up here within ttl seconds, this worker's own
+    changes at once
+'''
+class Menu:
+    def __init__(self, ttl=5, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._version = None
+        self._expires = 0
+        self._bodies = {}
+
+    '''
+    current()
+        (version, changed_at) of the menu
+    '''
+    def current(self):
+        with self._lock:
+            if self._version is not None and self.clock() < self._expires:
+                return self._version
+        row = db.session.query(MenuVersion.version, MenuVersion.changed_at).\
+            filter(MenuVersion.id == 1).one()
+        version = (row.version, row.changed_at)
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._bodies.clear()
+            self._expires = self.clock() + self.ttl
+        return version
+
+    '''
+    validators()
+        the etag and last modified time of the current menu
+        the etag has the time too, as the version starts again from 0
+        when the tables are recreated
+    '''
+    def validators(self):
+        version, changed_at = self.current()
+        return f'{version}-{changed_at:%Y%m%d%H%M%S}', changed_at
+
+    '''
+    json(form)
+        the response body listing every drink in form 'short' or 'long'
+    '''
+    def json(self, form):
+        version = self.current()
+        with self._lock:
+            body = self._bodies.get((form, version))
+        if body is None:
+            # the drinks are read after the version, so they're never older
+            drinks = [getattr(d, form)() for d in Drink.query]
+            body = flask_json.dumps({
+                "success": True,
+                "drinks": drinks
+            })
+            with self._lock:
+                if version == self._version:
+                    self._bodies[(form, version)] = body
+        return body
+
+    '''
+    expire()
+        read the version row again on the next request
+    '''
+    def expire(self):
+        with self._lock:
+            self._expires = 0
+
+
+menu = Menu()
+
+
+def _drink_changed(mapper, connection, drink):
+    table = MenuVersion.__table__
+    connection.execute(table.update().
+                       where(table.c.id == 1).
+                       values(version=table.c.version + 1, changed_at=_now()))
+    session = object_session(drink)
+    if session is not None:
+        session.info['menu_changed'] = True
+
+
+for name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Drink, name, _drink_changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _menu_committed(session):
+    if session.info.pop('menu_changed', False):
+        menu.expire()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _menu_rolled_back(session, previous_transaction):
+    session.info.pop('menu_changed', None)
@@ -0,0 +1,69 @@
+#Moves an existing drink table onto the JSON recipe column.
+#
+#Recipes used to be json text in a String(180) column.  Every stored
+#recipe is checked against the recipe schema first, and nothing is
+#changed if any fail.  On Postgres the column is then converted to json
+#in place.  SQLite doesn't need converting, its JSON columns hold the
+#same text.
+#
+#It also adds the menu_version table the menu cache reads, if it's missing.
+#
+#usage: python upgrade_recipes.py [database url]
+#  the url defaults to the app's sqlite database
+
+import json
+import sys
+
+from flask import Flask
+from sqlalchemy import inspect, text
+
+from src.database.models import db, database_path, Drink, MenuVersion, validate_recipe, _now
+
+
+def bad_recipes():
+    '''(id, reason) for every stored recipe that isn't valid'''
+    bad = []
+    table = Drink.__tablename__
+    for id_, recipe in db.session.execute(text(f'SELECT id, recipe FROM {table}')):
+        try:
+            if isinstance(recipe, str):
+                recipe = json.loads(recipe)
+            validate_recipe(recipe)
+        except ValueError as e:
+            bad.append((id_, str(e)))
+    return bad
+
+
+def main(url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        bad = bad_recipes()
+        for id_, reason in bad:
+            print(f'drink {id_}: {reason}')
+        if bad:
+            print(f'{len(bad)} bad recipes, fix them and run this again')
+            return 1
+
+        table = Drink.__tablename__
+        column = {c['name']: c for c in inspect(db.engine).get_columns(table)}['recipe']
+        if db.engine.name == 'postgresql' and str(column['type']).upper() != 'JSON':
+            db.session.execute(text(
+                f'ALTER TABLE {table} ALTER COLUMN recipe TYPE json USING recipe::json'))
+            db.session.commit()
+            print('recipe column converted to json')
+        else:
+            print('nothing to convert')
+
+        MenuVersion.__table__.create(db.engine, checkfirst=True)
+        if MenuVersion.query.get(1) is None:
+            db.session.add(MenuVersion(id=1, version=0, changed_at=_now()))
+            db.session.commit()
+            print('menu_version added')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1] if len(sys.argv) > 1 else database_path))
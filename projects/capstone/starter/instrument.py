@@ -0,0 +1,201 @@
+#Request instrumentation for the Flask apps in this repo.
+#
+#  Instrumentation(app)  or  instrumentation.init_app(app)
+#
+#For every request it measures wall time, the number of SQL statements
+#and the time spent in them, template rendering time and response size.
+#An app that already counts its SQL per request passes sql_stats, a
+#function returning (statements, seconds) for the current request, and
+#then no SQL listeners are added for it.
+#Each request is logged as one line of JSON on the '<app name>.requests'
+#logger, and histograms per endpoint are served in the Prometheus text
+#format at /metrics.
+#
+#Config:
+#  INSTRUMENT_LOG           log each request (default True)
+#  INSTRUMENT_METRICS_PATH  where to serve the histograms, None for nowhere
+#                           (default '/metrics')
+#
+#The projects are deployed on their own, so each one carries an
+#identical copy of this file.  Change them together.
+
+import json
+import logging
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+import jinja2
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Histogram:
+  """Cumulative histogram per label value, Prometheus style."""
+  def __init__(self, name, help, buckets, label='endpoint'):
+    self.name = name
+    self.help = help
+    self.buckets = buckets
+    self.label = label
+    #label value: [counts per bucket and one for +Inf, sum]
+    self._series = {}
+
+  def observe(self, label_value, value):
+    series = self._series.get(label_value)
+    if series is None:
+      series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0]
+    series[0][bisect_left(self.buckets, value)] += 1
+    series[1] += value
+
+  def lines(self):
+    yield f'# HELP {self.name} {self.help}'
+    yield f'# TYPE {self.name} histogram'
+    for label_value, (counts, total) in sorted(self._series.items()):
+      label = f'{self.label}="{label_value}"'
+      cumulative = 0
+      for bound, n in zip(self.buckets + ('+Inf',), counts):
+        cumulative += n
+        yield f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}'
+      yield f'{self.name}_sum{{{label}}} {total:g}'
+      yield f'{self.name}_count{{{label}}} {cumulative}'
+
+
+class Instrumentation:
+  def __init__(self, app=None, sql_stats=None):
+    self.sql_stats = sql_stats
+    self._lock = threading.Lock()
+    self.requests = {}
+    self.histograms = (
+      Histogram('flask_request_duration_seconds', 'Time to build the response.', SECONDS_BUCKETS),
+      Histogram('flask_request_sql_seconds', 'Time spent running SQL.', SECONDS_BUCKETS),
+      Histogram('flask_request_queries', 'SQL statements run.', QUERY_BUCKETS),
+      Histogram('flask_request_template_seconds', 'Time spent rendering templates.', SECONDS_BUCKETS),
+      Histogram('flask_response_bytes', 'Response body size.', BYTES_BUCKETS),
+    )
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('INSTRUMENT_LOG', True)
+    app.config.setdefault('INSTRUMENT_METRICS_PATH', '/metrics')
+    app.extensions['instrument'] = self
+    logger = logging.getLogger(f'{app.name}.requests')
+    app.jinja_env.template_class = _TimedTemplate
+    if self.sql_stats is None:
+      _listen_for_sql()
+
+    @app.before_request
+    def start_timer():
+      g.instrument = {'start': perf_counter(), 'queries': 0, 'sql': 0.0, 'template': 0.0}
+
+    @app.after_request
+    def record(response):
+      stats = g.pop('instrument', None)
+      if stats is None:
+        return response
+      if self.sql_stats is not None:
+        stats['queries'], stats['sql'] = self.sql_stats()
+      wall = perf_counter() - stats['start']
+      #streamed bodies have no length until they're sent
+      size = None if response.is_streamed else response.calculate_content_length()
+      endpoint = request.endpoint or '<unmatched>'
+      self.observe(endpoint, response.status_code, wall, stats, size)
+      if app.config['INSTRUMENT_LOG']:
+        logger.info(json.dumps({
+          'method': request.method,
+          'path': request.path,
+          'endpoint': endpoint,
+          'status': response.status_code,
+          'ms': round(wall * 1000, 2),
+          'queries': stats['queries'],
+          'sql_ms': round(stats['sql'] * 1000, 2),
+          'template_ms': round(stats['template'] * 1000, 2),
+          'bytes': size,
+        }))
+      return response
+
+    path = app.config['INSTRUMENT_METRICS_PATH']
+    if path:
+      app.add_url_rule(path, 'metrics', self.metrics_view)
+
+  def observe(self, endpoint, status, wall, stats, size):
+    duration, sql, queries, template, size_histogram = self.histograms
+    with self._lock:
+      key = (endpoint, status)
+      self.requests[key] = self.requests.get(key, 0) + 1
+      duration.observe(endpoint, wall)
+      sql.observe(endpoint, stats['sql'])
+      queries.observe(endpoint, stats['queries'])
+      template.observe(endpoint, stats['template'])
+      if size is not None:
+        size_histogram.observe(endpoint, size)
+
+  def metrics(self):
+    """Everything recorded so far, in the Prometheus text format."""
+    with self._lock:
+      lines = [
+        '# HELP flask_requests_total Requests answered.',
+        '# TYPE flask_requests_total counter',
+      ]
+      lines.extend(
+        f'flask_requests_total{{endpoint="{endpoint}",status="{status}"}} {n}'
+        for (endpoint, status), n in sorted(self.requests.items())
+      )
+      for histogram in self.histograms:
+        lines.extend(histogram.lines())
+    return '\n'.join(lines) + '\n'
+
+  def metrics_view(self):
+    return self.metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+
+def _add(name, amount):
+  if has_request_context():
+    stats = g.get('instrument')
+    if stats is not None:
+      stats[name] += amount
+
+#----------------------------------------------------------------------------#
+# SQL.
+#----------------------------------------------------------------------------#
+
+#Listening on the Engine class catches whatever engine the app ends up with.
+#The start time is kept on the statement's execution context, so one
+#that fails doesn't leave it behind.
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  if context is not None:
+    context.instrument_start = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  start = getattr(context, 'instrument_start', None)
+  if start is not None:
+    _add('queries', 1)
+    _add('sql', perf_counter() - start)
+
+
+def _listen_for_sql():
+  #once, however many apps are instrumented
+  for name, listener in (('before_cursor_execute', _before_cursor_execute),
+                         ('after_cursor_execute', _after_cursor_execute)):
+    if not event.contains(Engine, name, listener):
+      event.listen(Engine, name, listener)
+
+#----------------------------------------------------------------------------#
+# Templates.
+#----------------------------------------------------------------------------#
+
+class _TimedTemplate(jinja2.Template):
+  #flask's template signals need blinker, this doesn't
+  def render(self, *args, **kwargs):
+    start = perf_counter()
+    try:
+      return super().render(*args, **kwargs)
+    finally:
+      _add('template', perf_counter() - start)